@@ -42,6 +42,26 @@ def deploy():
 
     run('restart')
 
+    if env.host_string in env.roledefs['production-1']:
+        install_cron()
+
+
+# Deleting images and renditions only queues their files, and the pages
+# each response showed are kept until it hasn't been rendered for a while.
+# These cron jobs delete the files from storage every 10 minutes, and the old
+# pages every night. They run on one host, as both are in the shared database
+CRON_JOBS = [
+    ('delete_queued_files', "*/10 * * * *"),
+    ('delete_old_page_dependencies', "30 3 * * *"),
+]
+
+
+@roles('production-1')
+def install_cron():
+    for command, schedule in CRON_JOBS:
+        line = "%s bash -lc 'cd /usr/local/django/tbxwagtail/ && manage %s' > /dev/null" % (schedule, command)
+        run('(crontab -l 2>/dev/null | grep -v %s; echo "%s") | crontab -' % (command, line))
+
 
 @roles('production-1')
 def pull_live_data():
@@ -1,7 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_init
 
 
 class TorchboxCoreAppConfig(AppConfig):
     name = 'tbx.core'
     label = 'torchbox'
     verbose_name = "Torchbox"
+
+    def ready(self):
+        from wagtail.wagtailcore.models import Page, PAGE_MODEL_CLASSES
+
+        # Connect the cache invalidation signal handlers
+        import tbx.core.signal_handlers
+
+        # Every page model is registered by now. Page itself isn't in
+        # PAGE_MODEL_CLASSES
+        for model in [Page] + PAGE_MODEL_CLASSES:
+            post_init.connect(tbx.core.signal_handlers.page_loaded, sender=model)
@@ -0,0 +1,47 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import force_bytes
+from django.utils.safestring import mark_safe
+
+from tbx.core.rendition_cache import get_image_version
+
+
+def get_card_key(template_name, page, image, site):
+    # Everything a card shows comes from the page's latest revision, its URL,
+    # its image and (for blog posts) its author summary
+    version = [page.url_path, page.latest_revision_created_at, getattr(page, 'author_summary', None)]
+    if image:
+        version.append(get_image_version(image))
+
+    return 'card:%s:%s:%d:%s' % (
+        template_name, site.id if site else '', page.id, hashlib.md5(force_bytes(repr(version))).hexdigest()
+    )
+
+
+def render_cards(request, template_name, name, pages, prefetch, image_field):
+    """
+    Renders a card template for each of a list of pages, as 'name' in the
+    template's context. Cards for pages that haven't changed come from the
+    cache in one lookup, and only the rest are rendered, after loading their
+    renditions through the ListingPrefetch.
+    """
+    site = getattr(request, 'site', None)
+    keys = [get_card_key(template_name, page, getattr(page, image_field), site) for page in pages]
+    cards = cache.get_many(keys)
+
+    missing = [(page, key) for page, key in zip(pages, keys) if key not in cards]
+    if missing:
+        prefetch.load_renditions([page for page, key in missing])
+
+        card_template = template.loader.get_template(template_name)
+        rendered = dict(
+            (key, card_template.render(template.Context({name: page, 'request': request})))
+            for page, key in missing
+        )
+        cache.set_many(rendered, getattr(settings, 'CARD_CACHE_TIMEOUT', 60 * 60))
+        cards.update(rendered)
+
+    return [mark_safe(cards[key]) for key in keys]
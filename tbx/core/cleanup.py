@@ -0,0 +1,55 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from tbx.core.models import PageDependency, QueuedFileDeletion
+
+
+logger = logging.getLogger(__name__)
+
+
+def delete_queued_files(batch_size=100, after_id=0):
+    """
+    Deletes the next batch of files in the QueuedFileDeletion queue (after
+    the given queue id) from storage. Images and renditions both keep their
+    files in the default storage.
+
+    Files that can't be deleted are logged and stay in the queue to be tried
+    again next time. Returns (last queue id in the batch, number deleted,
+    number failed), with None as the id when the queue is empty.
+    """
+    batch = list(
+        QueuedFileDeletion.objects.filter(id__gt=after_id).order_by('id').values_list('id', 'name')[:batch_size]
+    )
+    if not batch:
+        return None, 0, 0
+
+    deleted_ids = []
+    for queue_id, name in batch:
+        try:
+            default_storage.delete(name)
+        except Exception:
+            logger.exception("Couldn't delete %s", name)
+        else:
+            deleted_ids.append(queue_id)
+
+    QueuedFileDeletion.objects.filter(id__in=deleted_ids).delete()
+
+    return batch[-1][0], len(deleted_ids), len(batch) - len(deleted_ids)
+
+
+def delete_old_page_dependencies():
+    """
+    Deletes the pages recorded for responses and cached listings that
+    haven't been rendered for PAGE_DEPENDENCY_MAX_AGE seconds, as they are
+    no longer cached. Returns the number of rows deleted.
+    """
+    max_age = getattr(settings, 'PAGE_DEPENDENCY_MAX_AGE', 7 * 24 * 60 * 60)
+    old = PageDependency.objects.filter(recorded_at__lt=timezone.now() - timedelta(seconds=max_age))
+
+    count = old.count()
+    old.delete()
+    return count
@@ -0,0 +1,90 @@
+import threading
+from contextlib import contextmanager
+
+
+# A stack of the sets of page ids being recorded in this thread, innermost
+# last. None stands for a pause in recording
+_recordings = threading.local()
+
+
+def _get_stack():
+    stack = getattr(_recordings, 'stack', None)
+    if stack is None:
+        stack = _recordings.stack = []
+    return stack
+
+
+def start_request_recording():
+    """
+    Gets ready to record the pages the current request reads. Nothing is
+    recorded until it starts serving a Wagtail page (see
+    start_page_recording), so responses from other views aren't recorded.
+    """
+    # Anything left over from a request that failed is thrown away
+    _recordings.stack = [None]
+
+
+def start_page_recording(page_ids):
+    """
+    Starts recording the pages the current request reads, from the given
+    ones. Called when Wagtail starts serving a page, so the pages it loaded
+    to find it aren't recorded
+    """
+    if _get_stack():
+        _recordings.stack = [set(page_ids)]
+
+
+def end_request_recording():
+    """
+    Stops recording for the current request and returns the ids of the pages
+    it read, or None if it wasn't recording a page
+    """
+    stack = _get_stack()
+    page_ids = stack[0] if stack else None
+    _recordings.stack = []
+    return page_ids
+
+
+def record_pages(page_ids):
+    """
+    Notes that whatever is being rendered shows content from the pages with
+    the given ids. Pages loaded from the database are recorded by the
+    page_loaded signal handler; this is for content that comes from
+    elsewhere, such as snapshots. Outside of a recording it does nothing.
+    """
+    stack = _get_stack()
+    if stack and stack[-1] is not None:
+        stack[-1].update(page_ids)
+
+
+@contextmanager
+def recording():
+    """
+    Records the ids of the pages read inside the block into the set it gives.
+    They are recorded by any surrounding recording too. eg.
+
+        with recording() as page_ids:
+            content = render_to_string(...)
+    """
+    stack = _get_stack()
+    page_ids = set()
+    stack.append(page_ids)
+    try:
+        yield page_ids
+    finally:
+        stack.pop()
+        record_pages(page_ids)
+
+
+@contextmanager
+def paused():
+    """
+    Stops recording inside the block. Used while building snapshots, whose
+    users record the pages they show from them.
+    """
+    stack = _get_stack()
+    stack.append(None)
+    try:
+        yield
+    finally:
+        stack.pop()
@@ -0,0 +1,191 @@
+import atexit
+import logging
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.core.urlresolvers import reverse
+from django.dispatch import receiver
+from django.utils.http import urlquote
+
+from wagtail.wagtailcore.models import Site
+from wagtail.contrib.wagtailfrontendcache.utils import get_backends
+
+from tbx.core.models import BlogIndexPage, BlogPage, HomePage, JobIndexPage, \
+    PersonPage, WorkIndexPage, WorkPage
+from tbx.core.utils import play_filter, get_ancestor_paths
+
+
+logger = logging.getLogger(__name__)
+
+
+# Index pages with tag-filtered listings, with the page types they list
+TAGGED_INDEXES = (
+    (BlogIndexPage, BlogPage),
+    (WorkIndexPage, WorkPage),
+)
+
+# work_and_blog_listing shows this many of each on the homepage
+HOMEPAGE_LISTING_COUNT = 5
+
+
+def get_root_url(page):
+    for (id, root_path, root_url) in Site.get_site_root_paths():
+        if page.url_path.startswith(root_path):
+            return root_url
+
+
+def get_page_urls(page):
+    page_url = page.full_url
+    if page_url is None:
+        return []
+
+    return [page_url + path[1:] for path in page.get_cached_paths()]
+
+
+def shows_on_homepage(page):
+    if isinstance(page, (PersonPage, JobIndexPage)):
+        # People are picked at random and the job index lists the jobs
+        return True
+
+    for page_model, ordering in ((BlogPage, '-date'), (WorkPage, '-pk')):
+        if isinstance(page, page_model):
+            if not page.live:
+                # It may have been on the homepage until now
+                return True
+
+            pages = play_filter(page_model.objects.filter(live=True).order_by(ordering), HOMEPAGE_LISTING_COUNT)
+            return page.id in pages.values_list('id', flat=True)
+
+    return False
+
+
+def get_purge_urls(page):
+    """
+    Returns the full URLs that publishing or unpublishing a (specific) page
+    changes, besides the responses recorded as showing it (see
+    PageDependency): the page itself, its parent and the tag-filtered
+    listings of the indexes above it, the pages either side of it, the blog
+    feed for blog posts, the pages people are authors of, and the homepage if
+    the page shows up there
+    """
+    urls = get_page_urls(page)
+
+    parent = page.get_parent()
+    if parent:
+        urls.extend(get_page_urls(parent.specific))
+
+    ancestor_paths = get_ancestor_paths(page.path)
+    for index_model, page_model in TAGGED_INDEXES:
+        if isinstance(page, page_model):
+            tag_slugs = list(page.tags.values_list('tag__slug', flat=True))
+            for index in index_model.objects.filter(path__in=ancestor_paths, live=True):
+                index_url = index.full_url
+                if index_url is not None:
+                    urls.append(index_url)
+                    urls.extend(index_url + '?tag=' + urlquote(slug) for slug in tag_slugs)
+
+    root_url = get_root_url(page)
+    if root_url is not None:
+        if isinstance(page, (BlogPage, WorkPage)):
+            # Their previous and next links may have changed
+            for neighbour in page.get_neighbours():
+                if neighbour:
+                    urls.append(root_url + neighbour.url if neighbour.url.startswith('/') else neighbour.url)
+
+        if isinstance(page, BlogPage):
+            urls.append(root_url + reverse('blog_feed'))
+
+    if isinstance(page, PersonPage):
+        # Blog posts and work pages show their authors' names and photos
+        for page_model in (BlogPage, WorkPage):
+            for authored in page_model.objects.filter(related_author__author=page, live=True).distinct():
+                urls.extend(get_page_urls(authored))
+
+    if shows_on_homepage(page):
+        for homepage in HomePage.objects.filter(live=True):
+            urls.extend(get_page_urls(homepage))
+
+    return urls
+
+
+class PurgeBatcher(object):
+    """
+    Collects URLs to purge from the frontend caches set up in
+    WAGTAILFRONTENDCACHE (one for each production host), and purges each of
+    them once when the request that asked for them has finished, or when the
+    process exits for management commands and the shell. So publishing
+    several pages at once doesn't purge the same index and homepage over and
+    over.
+    """
+    def __init__(self):
+        self.urls = set()
+        self.lock = threading.Lock()
+
+    def add(self, urls):
+        with self.lock:
+            self.urls.update(urls)
+
+    def flush(self):
+        with self.lock:
+            urls = sorted(self.urls)
+            self.urls = set()
+
+        if not urls:
+            return
+
+        for backend_name, backend in get_backends().items():
+            for url in urls:
+                logger.info("[%s] Purging URL: %s", backend_name, url)
+                try:
+                    backend.purge(url)
+                except Exception:
+                    logger.exception("[%s] Couldn't purge %s", backend_name, url)
+
+
+purge_batcher = PurgeBatcher()
+atexit.register(purge_batcher.flush)
+
+
+@receiver(request_finished)
+def flush_purges(sender, **kwargs):
+    purge_batcher.flush()
+
+
+def is_enabled():
+    return bool(getattr(settings, 'WAGTAILFRONTENDCACHE', None))
+
+
+def purge_page(page):
+    if is_enabled():
+        purge_batcher.add(get_purge_urls(page))
+
+
+def purge_urls(urls):
+    if is_enabled():
+        purge_batcher.add(urls)
+
+
+class PurgeRequestHandler(BaseHTTPRequestHandler):
+    def do_PURGE(self):
+        url = 'http://%s%s' % (self.headers.get('Host', ''), self.path)
+        self.server.purged.append(url)
+        logger.info("Purged %s", url)
+
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PurgeServer(HTTPServer):
+    """
+    A stand-in for the cache server's purge endpoint, for trying out purging
+    locally. It answers every PURGE request with a 200 and keeps the URLs it
+    was asked to purge in 'purged'.
+    """
+    def __init__(self, address):
+        HTTPServer.__init__(self, address, PurgeRequestHandler)
+        self.purged = []
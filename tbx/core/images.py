@@ -0,0 +1,152 @@
+import re
+
+from PIL import Image as PILImage
+
+from django.conf import settings
+
+from wagtail.wagtailimages.image_operations import Operation
+
+from willow.backends.pillow import PillowBackend
+
+
+# WebP renditions
+
+@PillowBackend.register_operation('save_as_webp')
+def save_as_webp(backend, f, quality=80):
+    if backend.image.mode in ['1', 'P']:
+        backend.image = backend.image.convert('RGBA')
+
+    backend.image.save(f, 'WEBP', quality=quality)
+
+
+class FormatOperation(Operation):
+    """
+    Filter spec operation that changes the format a rendition is saved in,
+    eg. "width-400 format-webp". Registered in wagtail_hooks.py
+    """
+    def construct(self, format):
+        if format != 'webp':
+            raise ValueError("Unsupported format: %s" % format)
+        self.format = format
+
+    def run(self, willow, image):
+        willow.original_format = self.format
+
+
+def can_save_webp():
+    # Pillow can be built without WebP support, in which case WebP renditions
+    # can never be generated
+    PILImage.init()
+    return 'WEBP' in PILImage.SAVE
+
+
+def get_webp_spec(filter_spec):
+    return filter_spec + ' format-webp'
+
+
+def is_webp_spec(filter_spec):
+    return filter_spec.split()[-1] == 'format-webp'
+
+
+# "Display max" renditions
+
+@PillowBackend.register_operation('save_as_progressive_jpeg')
+def save_as_progressive_jpeg(backend, f):
+    if backend.image.mode in ['1', 'P']:
+        backend.image = backend.image.convert('RGB')
+
+    quality = getattr(settings, 'WAGTAILIMAGES_JPEG_QUALITY', 85)
+    backend.image.save(f, 'JPEG', quality=quality, progressive=True, optimize=True)
+
+
+@PillowBackend.register_operation('save_as_optimized_png')
+def save_as_optimized_png(backend, f):
+    backend.image.save(f, 'PNG', optimize=True)
+
+
+# The formats that display renditions are saved in, by original format
+DISPLAY_FORMATS = {
+    'jpeg': 'progressive_jpeg',
+    'png': 'optimized_png',
+    'gif': 'optimized_png',
+    'bmp': 'optimized_png',
+}
+
+
+class DisplayOperation(Operation):
+    """
+    Filter spec operation for showing an image as large as it can reasonably
+    be shown, eg. "display-2000x2000". Scales the image down to fit inside
+    the size (never up) and saves it as a progressive JPEG or an optimised
+    PNG. Registered in wagtail_hooks.py
+    """
+    def construct(self, size):
+        width, height = size.split('x')
+        self.width = int(width)
+        self.height = int(height)
+
+    def run(self, willow, image):
+        image_width, image_height = willow.get_size()
+        scale = min(float(self.width) / image_width, float(self.height) / image_height)
+        if scale < 1:
+            willow.resize((max(int(image_width * scale), 1), max(int(image_height * scale), 1)))
+
+        willow.original_format = DISPLAY_FORMATS.get(willow.original_format, willow.original_format)
+
+
+def get_display_spec():
+    return 'display-%dx%d' % settings.DISPLAY_IMAGE_MAX_SIZE
+
+
+def get_display_size(filter_spec):
+    """
+    Returns the (width, height) a display filter spec fits images inside, or
+    None if it isn't a display filter spec
+    """
+    match = re.match(r'^display-(\d+)x(\d+)$', filter_spec)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+
+
+# The extensions of the formats Wagtail's get_rendition doesn't know about
+OUTPUT_EXTENSIONS = {
+    'webp': '.webp',
+    'progressive_jpeg': '.jpg',
+    'optimized_png': '.png',
+}
+
+
+# Responsive images
+
+def get_responsive_variants(filter_spec):
+    """
+    Returns the (filter spec, WebP filter spec) pairs used to make a srcset
+    for the given filter spec, smallest first. Width and fill specs get
+    scaled down versions at each of the RESPONSIVE_IMAGE_WIDTHS narrower than
+    them; other specs only get a WebP version.
+    """
+    specs = [filter_spec]
+
+    match = re.match(r'^(width|fill|max)-(\d+)(?:x(\d+))?(-c\d+)?$', filter_spec)
+    if match:
+        method, width, height, crop = match.groups()
+        width = int(width)
+
+        for smaller_width in sorted(settings.RESPONSIVE_IMAGE_WIDTHS, reverse=True):
+            if smaller_width >= width:
+                continue
+
+            if height is None:
+                specs.insert(0, '%s-%d' % (method, smaller_width))
+            else:
+                smaller_height = int(height) * smaller_width // width
+                specs.insert(0, '%s-%dx%d%s' % (method, smaller_width, smaller_height, crop or ''))
+
+    return [(spec, get_webp_spec(spec)) for spec in specs]
+
+
+def get_responsive_specs(filter_spec):
+    """
+    Returns every filter spec the responsive_image tag uses for a filter spec
+    """
+    return [spec for variant in get_responsive_variants(filter_spec) for spec in variant]
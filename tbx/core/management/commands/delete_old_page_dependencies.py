@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from tbx.core.cleanup import delete_old_page_dependencies
+
+
+class Command(BaseCommand):
+    help = "Deletes the pages recorded for responses that haven't been rendered for PAGE_DEPENDENCY_MAX_AGE seconds"
+
+    def handle(self, *args, **options):
+        self.stdout.write("%d page dependencies deleted" % delete_old_page_dependencies())
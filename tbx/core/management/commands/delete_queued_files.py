@@ -0,0 +1,55 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from tbx.core.cleanup import delete_queued_files
+
+
+class Command(BaseCommand):
+    help = "Deletes the files of deleted images and renditions from storage"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--batch-size',
+            type='int',
+            default=100,
+            help="Number of files to delete per batch (defaults to 100)"
+        ),
+        make_option(
+            '--watch',
+            action='store_true',
+            default=False,
+            help="Keep running, checking the queue every --interval seconds"
+        ),
+        make_option(
+            '--interval',
+            type='int',
+            default=10,
+            help="Seconds to wait between checks with --watch (defaults to 10)"
+        ),
+    )
+
+    def empty_queue(self, batch_size):
+        after_id = 0
+        deleted = failed = 0
+        while True:
+            after_id, batch_deleted, batch_failed = delete_queued_files(batch_size, after_id)
+            if after_id is None:
+                break
+
+            deleted += batch_deleted
+            failed += batch_failed
+
+        return deleted, failed
+
+    def handle(self, *args, **options):
+        while True:
+            deleted, failed = self.empty_queue(options['batch_size'])
+            if deleted or failed or not options['watch']:
+                self.stdout.write("%d files deleted, %d failed" % (deleted, failed))
+
+            if not options['watch']:
+                break
+
+            time.sleep(options['interval'])
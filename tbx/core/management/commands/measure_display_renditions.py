@@ -0,0 +1,82 @@
+import time
+from io import BytesIO
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from wagtail.wagtailimages.models import Filter, SourceImageIOError
+
+from tbx.core.images import get_display_size, get_display_spec
+from tbx.core.models import TorchboxImage
+
+
+class Command(BaseCommand):
+    help = "Compares the size and rendering time of display renditions with the renditions they replace. Nothing is saved"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--compare-with',
+            default='width-9999',
+            help="Filter spec to compare display renditions with (defaults to width-9999)"
+        ),
+        make_option(
+            '--limit',
+            type='int',
+            help="Only measure this many images"
+        ),
+    )
+
+    def run_filter(self, image, spec):
+        start = time.time()
+        output, output_format = Filter(spec=spec).run(image, BytesIO())
+        return len(output.getvalue()), time.time() - start
+
+    def handle(self, *args, **options):
+        old_spec = options['compare_with']
+        new_spec = get_display_spec()
+        max_width, max_height = get_display_size(new_spec)
+
+        images = TorchboxImage.objects.order_by('id')
+        if options['limit']:
+            images = images[:options['limit']]
+
+        self.stdout.write("Comparing %s with %s" % (new_spec, old_spec))
+
+        old_bytes = new_bytes = 0
+        old_time = new_time = 0.0
+        measured = reused = 0
+        for image in images:
+            try:
+                old_size, old_elapsed = self.run_filter(image, old_spec)
+
+                if image.width <= max_width and image.height <= max_height:
+                    # Served as the original file, as TorchboxImage.get_rendition does
+                    new_size, new_elapsed = image.file.size, 0.0
+                    reused += 1
+                else:
+                    new_size, new_elapsed = self.run_filter(image, new_spec)
+            except (SourceImageIOError, IOError) as e:
+                self.stderr.write("Image %d: %s" % (image.id, e))
+                continue
+
+            measured += 1
+            old_bytes += old_size
+            new_bytes += new_size
+            old_time += old_elapsed
+            new_time += new_elapsed
+
+            if int(options['verbosity']) > 1:
+                self.stdout.write("Image %d (%dx%d): %d -> %d bytes, %.0fms -> %.0fms" % (
+                    image.id, image.width, image.height, old_size, new_size, old_elapsed * 1000, new_elapsed * 1000
+                ))
+
+        if not measured:
+            self.stdout.write("No images to measure")
+            return
+
+        self.stdout.write("%d images, %d shown as the original file" % (measured, reused))
+        self.stdout.write("Bytes: %d -> %d (%d saved, %.1f%%)" % (
+            old_bytes, new_bytes, old_bytes - new_bytes, 100.0 * (old_bytes - new_bytes) / max(old_bytes, 1)
+        ))
+        self.stdout.write("Rendering time: %.2fs -> %.2fs (%.0fms -> %.0fms per image)" % (
+            old_time, new_time, old_time * 1000 / measured, new_time * 1000 / measured
+        ))
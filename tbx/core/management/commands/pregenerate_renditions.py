@@ -0,0 +1,62 @@
+import multiprocessing
+import time
+from functools import partial
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tbx.core.models import TorchboxImage
+from tbx.core.renditions import close_connections, generate_renditions
+
+
+class Command(BaseCommand):
+    help = "Generates any missing standard renditions for every image in the library"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--processes',
+            type='int',
+            default=multiprocessing.cpu_count(),
+            help="Number of images to work on at once (defaults to the number of CPUs)"
+        ),
+        make_option(
+            '--spec',
+            action='append',
+            dest='specs',
+            help="Filter spec to generate, instead of PREGENERATED_RENDITIONS. Can be given more than once"
+        ),
+    )
+
+    def handle(self, *args, **options):
+        specs = options['specs'] or settings.PREGENERATED_RENDITIONS
+        image_ids = list(TorchboxImage.objects.order_by('id').values_list('id', flat=True))
+        self.stdout.write("Generating %s for %d images with %d processes" % (
+            ', '.join(specs), len(image_ids), options['processes']
+        ))
+
+        close_connections()
+        pool = multiprocessing.Pool(options['processes'])
+
+        start = time.time()
+        done = generated = failed = 0
+        try:
+            results = pool.imap_unordered(partial(generate_renditions, filter_specs=specs), image_ids)
+            for image_id, count, error in results:
+                done += 1
+                generated += count
+                if error is not None:
+                    failed += 1
+                    self.stderr.write("Image %d: %s" % (image_id, error))
+
+                if done % 50 == 0 or done == len(image_ids):
+                    elapsed = time.time() - start
+                    self.stdout.write("%d/%d images, %d renditions generated (%.1f images/s, %.1f renditions/s)" % (
+                        done, len(image_ids), generated, done / elapsed, generated / elapsed
+                    ))
+        finally:
+            pool.terminate()
+
+        self.stdout.write("Done in %.1fs. %d renditions generated, %d images failed" % (
+            time.time() - start, generated, failed
+        ))
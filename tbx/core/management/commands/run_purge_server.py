@@ -0,0 +1,27 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from tbx.core.frontend_cache import PurgeServer
+
+
+class Command(BaseCommand):
+    help = "Runs a stand-in cache server that prints the URLs it is asked to purge"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--port',
+            type='int',
+            default=8080,
+            help="Port to listen on (defaults to 8080)"
+        ),
+    )
+
+    def handle(self, *args, **options):
+        server = PurgeServer(('127.0.0.1', options['port']))
+        self.stdout.write("Listening for PURGE requests on port %d" % options['port'])
+
+        while True:
+            server.handle_request()
+            while server.purged:
+                self.stdout.write(server.purged.pop(0))
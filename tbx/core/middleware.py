@@ -0,0 +1,53 @@
+from django.conf import settings
+
+from tbx.core.dependencies import start_request_recording, end_request_recording
+from tbx.core.models import PageDependency
+from tbx.core.utils import start_request_memo, end_request_memo
+
+
+class PagePredicateMemoMiddleware(object):
+    """
+    Gives each request a fresh memo for the page predicates used by the
+    template tags (see request_memoize), and clears it once the response is
+    ready. With DEBUG on, the memo's hits and misses are reported in an
+    X-Page-Predicate-Memo response header.
+    """
+    def process_request(self, request):
+        start_request_memo()
+
+    def process_response(self, request, response):
+        stats = end_request_memo()
+        if settings.DEBUG and stats is not None:
+            response['X-Page-Predicate-Memo'] = 'hits=%d; misses=%d' % stats
+        return response
+
+
+class PageDependencyMiddleware(object):
+    """
+    Records the pages each response read while it was rendered, for the
+    responses the frontend cache keeps: successful GETs by anonymous users,
+    under the full URL the frontend cache keys them by. Only Wagtail pages
+    are recorded (see wagtail_hooks.py), as other views such as search show
+    whatever their parameters ask for. Ajax requests are left out, as they
+    share their URL with a full page.
+    When one of the pages is published, the response's URL is purged (see
+    signal_handlers.py). With DEBUG on, the number of pages is reported in an
+    X-Page-Dependencies response header.
+    """
+    def process_request(self, request):
+        start_request_recording()
+
+    def process_response(self, request, response):
+        page_ids = end_request_recording()
+        if page_ids is None:
+            return response
+
+        user = getattr(request, 'user', None)
+        if (request.method == 'GET' and response.status_code == 200 and not request.is_ajax()
+                and not (user and user.is_authenticated())):
+            PageDependency.save_dependencies(page_ids, url=request.build_absolute_uri())
+
+            if settings.DEBUG:
+                response['X-Page-Dependencies'] = str(len(page_ids))
+
+        return response
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def populate_tag_counts(apps, schema_editor):
+    IndexPageTagCount = apps.get_model('torchbox', 'IndexPageTagCount')
+
+    for index_model_name, tag_select_model_name in [
+        ('BlogIndexPage', 'BlogPageTagSelect'),
+        ('WorkIndexPage', 'WorkPageTagSelect'),
+    ]:
+        index_model = apps.get_model('torchbox', index_model_name)
+        tag_select_model = apps.get_model('torchbox', tag_select_model_name)
+
+        for index in index_model.objects.all():
+            counts = tag_select_model.objects.filter(
+                page__live=True,
+                page__path__startswith=index.path
+            ).order_by().values('tag').annotate(item_count=models.Count('page', distinct=True))
+
+            IndexPageTagCount.objects.bulk_create([
+                IndexPageTagCount(index_id=index.id, tag_id=count['tag'], count=count['item_count'])
+                for count in counts
+            ])
+
+
+def unpopulate_tag_counts(apps, schema_editor):
+    # The table is about to be dropped
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcore', '0001_squashed_0016_change_page_url_path_to_text_field'),
+        ('torchbox', '0014_workpage_show_in_play_menu'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexPageTagCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('count', models.PositiveIntegerField()),
+                ('index', models.ForeignKey(related_name='+', to='wagtailcore.Page')),
+                ('tag', models.ForeignKey(related_name='+', to='torchbox.BlogPageTagList')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='indexpagetagcount',
+            unique_together=set([('index', 'tag')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='indexpagetagcount',
+            index_together=set([('index', 'count')]),
+        ),
+        migrations.RunPython(populate_tag_counts, unpopulate_tag_counts),
+    ]
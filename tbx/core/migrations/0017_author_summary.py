@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+import json
+
+from django.db import models, migrations
+
+
+AVATAR_SPEC = 'fill-300x300'
+
+
+def get_focal_point_key(image):
+    # The same as Filter.get_cache_key for a fill filter, which varies with
+    # the image's focal point
+    vary_fields = ('focal_point_width', 'focal_point_height', 'focal_point_x', 'focal_point_y')
+    vary_string = '-'.join(str(getattr(image, field)) for field in vary_fields)
+    return hashlib.sha1(vary_string.encode('utf-8')).hexdigest()[:8]
+
+
+def get_root_paths(apps):
+    # The same as Site.get_site_root_paths, as (root path, root url) pairs
+    Site = apps.get_model('wagtailcore', 'Site')
+
+    root_paths = []
+    for site in Site.objects.select_related('root_page').order_by('-root_page__url_path'):
+        if site.port == 80:
+            root_url = 'http://%s' % site.hostname
+        elif site.port == 443:
+            root_url = 'https://%s' % site.hostname
+        else:
+            root_url = 'http://%s:%d' % (site.hostname, site.port)
+        root_paths.append((site.root_page.url_path, root_url))
+    return root_paths
+
+
+def get_page_url(root_paths, url_path):
+    # The same as Page.url. Wagtail serves pages from the root of the site
+    # (see tbx/urls.py)
+    for root_path, root_url in root_paths:
+        if url_path.startswith(root_path):
+            return ('' if len(root_paths) == 1 else root_url) + '/' + url_path[len(root_path):]
+
+
+def populate_author_summaries(apps, schema_editor):
+    TorchboxRendition = apps.get_model('torchbox', 'TorchboxRendition')
+
+    # Only renditions that already exist are used. Pages with authors whose
+    # avatars haven't been rendered yet are left without a summary, and get
+    # one when they are next published
+    avatars = {}
+    for rendition in TorchboxRendition.objects.filter(filter__spec=AVATAR_SPEC).select_related('image'):
+        if rendition.focal_point_key == get_focal_point_key(rendition.image):
+            avatars[rendition.image_id] = {
+                'url': rendition.file.url,
+                'width': rendition.width,
+                'height': rendition.height,
+                'alt': rendition.image.title,
+            }
+
+    root_paths = get_root_paths(apps)
+
+    for page_model_name, author_model_name in [
+        ('BlogPage', 'BlogPageAuthor'),
+        ('WorkPage', 'WorkPageAuthor'),
+    ]:
+        page_model = apps.get_model('torchbox', page_model_name)
+        author_model = apps.get_model('torchbox', author_model_name)
+
+        summaries = {}
+        related_authors = author_model.objects.filter(author__isnull=False).select_related('author').order_by('page', 'sort_order')
+        for related_author in related_authors:
+            person = related_author.author
+            if person.image_id is not None and person.image_id not in avatars:
+                summaries[related_author.page_id] = None
+                continue
+
+            authors = summaries.setdefault(related_author.page_id, [])
+            if authors is not None:
+                authors.append({
+                    'id': person.id,
+                    'title': person.title,
+                    'role': person.role,
+                    'url': get_page_url(root_paths, person.url_path),
+                    'avatar': avatars.get(person.image_id),
+                })
+
+        for page_id in page_model.objects.values_list('id', flat=True):
+            authors = summaries.get(page_id, [])
+            if authors is not None:
+                page_model.objects.filter(id=page_id).update(author_summary=json.dumps(authors))
+
+
+def unpopulate_author_summaries(apps, schema_editor):
+    # The columns are about to be dropped
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcore', '0001_squashed_0016_change_page_url_path_to_text_field'),
+        ('torchbox', '0016_queuedfiledeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpage',
+            name='author_summary',
+            field=models.TextField(null=True, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='workpage',
+            name='author_summary',
+            field=models.TextField(null=True, editable=False),
+            preserve_default=True,
+        ),
+        migrations.RunPython(populate_author_summaries, unpopulate_author_summaries),
+    ]
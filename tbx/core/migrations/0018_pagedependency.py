@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcore', '0001_squashed_0016_change_page_url_path_to_text_field'),
+        ('torchbox', '0017_author_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageDependency',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('url', models.CharField(db_index=True, max_length=255, blank=True)),
+                ('cache_key', models.CharField(db_index=True, max_length=255, blank=True)),
+                ('page', models.ForeignKey(related_name='+', to='wagtailcore.Page')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
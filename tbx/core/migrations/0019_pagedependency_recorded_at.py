@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('torchbox', '0018_pagedependency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagedependency',
+            name='recorded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, db_index=True),
+            preserve_default=True,
+        ),
+    ]
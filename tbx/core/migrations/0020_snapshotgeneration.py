@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('torchbox', '0019_pagedependency_recorded_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotGeneration',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('key', models.CharField(unique=True, max_length=255)),
+                ('generation', models.CharField(max_length=32)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -1,14 +1,31 @@
 from __future__ import unicode_literals
 
+import hashlib
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
 from datetime import date
+from io import BytesIO
 from django import forms
 
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files import File
+from django.db import models, transaction
 from django.db.models.signals import pre_delete
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.dispatch import receiver
+from django.dispatch import Signal, receiver
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified
+from django.template import RequestContext
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+from django.utils.encoding import force_bytes
+from django.utils.functional import cached_property
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
 
 from wagtail.wagtailcore.models import Page, Orderable
 from wagtail.wagtailcore.fields import RichTextField, StreamField
@@ -20,15 +37,24 @@ from wagtail.wagtailembeds.blocks import EmbedBlock
 from wagtail.wagtailimages.blocks import ImageChooserBlock
 from wagtail.wagtailimages.edit_handlers import ImageChooserPanel
 from wagtail.wagtailimages.models import Image
-from wagtail.wagtailimages.models import AbstractImage, AbstractRendition
+from wagtail.wagtailimages.models import AbstractImage, AbstractRendition, Filter, \
+    SourceImageIOError
 from wagtail.wagtaildocs.edit_handlers import DocumentChooserPanel
 from wagtail.wagtailsnippets.models import register_snippet
 
 from modelcluster.fields import ParentalKey
 from modelcluster.tags import ClusterTaggableManager
 from taggit.models import Tag, TaggedItemBase
+from PIL import Image as PILImage
 
-from tbx.core.utils import export_event
+from tbx.core.dependencies import paused, record_pages
+from tbx.core.images import OUTPUT_EXTENSIONS, get_display_size, is_webp_spec
+from tbx.core.pagination import KeysetPaginator
+from tbx.core.prefetch import BLOG_POST_PREFETCH, WORK_INDEX_PREFETCH, resolve_renditions
+from tbx.core.rendition_cache import cache_rendition, get_cached_rendition
+from tbx.core.sampling import Sampler
+from tbx.core.snapshots import Snapshot
+from tbx.core.utils import export_event, get_ancestor_paths, get_page_url, play_filter
 
 ### Streamfield blocks and config ###
 
@@ -253,12 +279,91 @@ class TorchboxImage(AbstractImage):
     def credit_text(self):
         return self.credit
 
+    def get_rendition(self, filter):
+        # Use the rendition found by tbx.core.prefetch.resolve_renditions, if
+        # there is one
+        spec = getattr(filter, 'spec', filter)
+        prefetched_rendition = getattr(self, 'prefetched_renditions', {}).get(spec)
+        if prefetched_rendition is not None:
+            return prefetched_rendition
+
+        display_size = get_display_size(spec)
+        if display_size is not None:
+            if self.width <= display_size[0] and self.height <= display_size[1]:
+                # Small enough already, so show the original rather than
+                # decoding and re-encoding it
+                rendition = self.renditions.model(image=self, width=self.width, height=self.height)
+                rendition.file.name = self.file.name
+                return rendition
+
+        # Renditions that have been used before are in the cache, so they
+        # don't need a query
+        rendition = get_cached_rendition(self, spec)
+        if rendition is not None:
+            return rendition
+
+        if display_size is not None or is_webp_spec(spec):
+            rendition = self.get_formatted_rendition(filter)
+        else:
+            rendition = super(TorchboxImage, self).get_rendition(filter)
+
+        cache_rendition(self, spec, rendition)
+        return rendition
+
+    def get_formatted_rendition(self, filter):
+        # Wagtail's get_rendition only knows the extensions of the formats
+        # it saves in itself, so this does the same thing for the ones in
+        # tbx.core.images.OUTPUT_EXTENSIONS
+        if not hasattr(filter, 'run'):
+            filter, created = Filter.objects.get_or_create(spec=filter)
 
-# Receive the pre_delete signal and delete the file associated with the model instance.
+        cache_key = filter.get_cache_key(self)
+
+        try:
+            return self.renditions.get(filter=filter, focal_point_key=cache_key)
+        except ObjectDoesNotExist:
+            generated_image, output_format = filter.run(self, BytesIO())
+
+            output_extension = '.'.join(filter.spec.split()) + OUTPUT_EXTENSIONS[output_format]
+            if cache_key:
+                output_extension = cache_key + '.' + output_extension
+
+            # Truncate the filename to keep it under 60 characters
+            input_filename = os.path.splitext(os.path.basename(self.file.name))[0]
+            output_filename = input_filename[:(59 - len(output_extension))] + '.' + output_extension
+
+            # Django can't always read the size of a WebP file from its first
+            # few chunks, so measure it here and store the file directly,
+            # rather than letting the rendition's ImageField do both
+            width, height = PILImage.open(generated_image).size
+            generated_image.seek(0)
+
+            file_field = self.renditions.model._meta.get_field('file')
+            output_filename = file_field.storage.save(
+                file_field.generate_filename(None, output_filename),
+                File(generated_image)
+            )
+
+            rendition, created = self.renditions.get_or_create(
+                filter=filter,
+                focal_point_key=cache_key,
+                defaults={
+                    'file': output_filename,
+                    'width': width,
+                    'height': height,
+                }
+            )
+            if not created:
+                # Someone else got there first
+                file_field.storage.delete(output_filename)
+
+            return rendition
+
+
+# Receive the pre_delete signal and queue the file associated with the model instance for deletion.
 @receiver(pre_delete, sender=TorchboxImage)
 def image_delete(sender, instance, **kwargs):
-    # Pass false so FileField doesn't save the model.
-    instance.file.delete(False)
+    QueuedFileDeletion.queue(instance.file)
 
 
 class TorchboxRendition(AbstractRendition):
@@ -270,11 +375,94 @@ class TorchboxRendition(AbstractRendition):
         )
 
 
-# Receive the pre_delete signal and delete the file associated with the model instance.
+# Receive the pre_delete signal and queue the file associated with the model instance for deletion.
 @receiver(pre_delete, sender=TorchboxRendition)
 def rendition_delete(sender, instance, **kwargs):
-    # Pass false so FileField doesn't save the model.
-    instance.file.delete(False)
+    QueuedFileDeletion.queue(instance.file)
+
+
+class QueuedFileDeletion(models.Model):
+    """
+    A file to delete from storage, once the image or rendition it belonged to
+    has been deleted. The files are queued in the same transaction as the
+    delete, so they are kept if it is rolled back, and the slow storage
+    deletes happen later, in batches, in the delete_queued_files command.
+    """
+    name = models.CharField(max_length=255)
+    queued_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def queue(cls, field_file):
+        if field_file.name:
+            cls.objects.create(name=field_file.name)
+
+
+class SnapshotGeneration(models.Model):
+    """
+    The current generation of a tbx.core.snapshots.Snapshot. They are kept in
+    the database rather than the cache, so invalidating a snapshot reaches
+    every web host.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    generation = models.CharField(max_length=32)
+
+
+class PageDependency(models.Model):
+    """
+    Records that a response (by its URL) or a cached piece of content (by its
+    cache key) shows content from a page, so both can be thrown away when
+    the page changes. The pages are recorded while the response or content
+    is rendered (see tbx.core.dependencies).
+
+    Each URL or cache key is recorded again at least every half of
+    PAGE_DEPENDENCY_MAX_AGE while it's in use, so the ones that haven't been
+    recorded for longer than that can be deleted (see
+    tbx.core.cleanup.delete_old_page_dependencies).
+    """
+    page = models.ForeignKey('wagtailcore.Page', related_name='+')
+    url = models.CharField(max_length=255, blank=True, db_index=True)
+    cache_key = models.CharField(max_length=255, blank=True, db_index=True)
+    recorded_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    @classmethod
+    def save_dependencies(cls, page_ids, url='', cache_key=''):
+        """
+        Replaces the pages recorded for a URL or cache key. The database is
+        only written to when they have changed since last time, or when they
+        are due to be recorded again.
+        """
+        if len(url) > 255 or len(cache_key) > 255:
+            return
+
+        page_ids = sorted(set(page_ids))
+        marker_key = 'page_dependencies:%s' % hashlib.md5(force_bytes(url + ' ' + cache_key)).hexdigest()
+        marker = hashlib.md5(force_bytes(repr(page_ids))).hexdigest()
+        if cache.get(marker_key) == marker:
+            return
+
+        # Pages can be deleted while snapshots still refer to them
+        page_ids = Page.objects.filter(id__in=page_ids).values_list('id', flat=True)
+
+        with transaction.atomic():
+            cls.objects.filter(url=url, cache_key=cache_key).delete()
+            cls.objects.bulk_create([
+                cls(page_id=page_id, url=url, cache_key=cache_key)
+                for page_id in page_ids
+            ])
+
+        cache.set(marker_key, marker, getattr(settings, 'PAGE_DEPENDENCY_MAX_AGE', 7 * 24 * 60 * 60) // 2)
+
+    @classmethod
+    def get_dependents(cls, page_ids):
+        """
+        Returns the (URLs, cache keys) recorded as showing content from any
+        of the given pages, as two sets
+        """
+        dependents = cls.objects.filter(page__in=page_ids).values_list('url', 'cache_key')
+
+        urls = set(url for url, cache_key in dependents if url)
+        cache_keys = set(cache_key for url, cache_key in dependents if cache_key)
+        return urls, cache_keys
 
 
 class HomePage(Page):
@@ -421,27 +609,182 @@ ServicesPage.promote_panels = [
 ]
 
 
+# Popular tags and tag filtering for index pages
+
+class TaggedIndexMixin(object):
+    """
+    For index pages whose descendants are tagged. Subclasses provide
+    tag_select_model, the model that links those descendants to their tags,
+    tagged_pages, a queryset of the live descendants, and listing_ordering,
+    the unique ordering they are listed in.
+
+    Tag counts are stored as IndexPageTagCounts and tag postings are kept in
+    a Snapshot. The signal handlers keep both up to date as pages are
+    published and tags change.
+    """
+    def update_tag_counts(self, tag_ids=None):
+        """
+        Recounts the live descendants using each tag, or only the given tags
+        """
+        tag_selects = self.tag_select_model.objects.filter(
+            page__live=True,
+            page__path__startswith=self.path
+        )
+        tag_counts = IndexPageTagCount.objects.filter(index=self)
+        if tag_ids is not None:
+            tag_selects = tag_selects.filter(tag__in=tag_ids)
+            tag_counts = tag_counts.filter(tag__in=tag_ids)
+
+        with transaction.atomic():
+            # Publishing two pages under the same index at once would
+            # otherwise insert the same (index, tag) row twice. Holding a
+            # lock on the index makes the second one count after the first
+            list(Page.objects.select_for_update().filter(id=self.id).values_list('id', flat=True))
+
+            # Clearing the ordering keeps sort_order out of the GROUP BY
+            counts = tag_selects.order_by().values('tag').annotate(item_count=models.Count('page', distinct=True))
+            tag_counts.delete()
+            IndexPageTagCount.objects.bulk_create([
+                IndexPageTagCount(index_id=self.id, tag_id=count['tag'], count=count['item_count'])
+                for count in counts
+            ])
+
+    def get_popular_tags(self, scope=None):
+        """
+        Returns the 10 most used tags among the live descendants of scope
+        (this page by default), most popular first
+        """
+        tag_counts = IndexPageTagCount.objects.filter(
+            index=scope or self
+        ).select_related('tag').order_by('-count', 'tag__name')
+
+        return [tag_count.tag for tag_count in tag_counts[:10]]
+
+    def build_tag_postings(self):
+        page_ids = list(self.tagged_pages.values_list('id', flat=True))
+        positions = dict((page_id, position) for position, page_id in enumerate(page_ids))
+
+        # Map each tag slug to the sorted positions of the pages using it
+        postings = {}
+        tag_selects = self.tag_select_model.objects.filter(
+            page__live=True,
+            page__path__startswith=self.path
+        ).values_list('tag__slug', 'page_id')
+        for slug, page_id in tag_selects:
+            if page_id in positions:
+                postings.setdefault(slug, set()).add(positions[page_id])
+
+        return {
+            'page_ids': page_ids,
+            'postings': dict((slug, sorted(tagged)) for slug, tagged in postings.items()),
+        }
+
+    @property
+    def tag_postings(self):
+        return Snapshot('tag_postings:%d' % self.id, self.build_tag_postings)
+
+    def get_tagged_page_ids(self, tags, match_all=True):
+        """
+        Returns the ids of live descendants tagged with all of the given tag
+        slugs (or any of them, if match_all is False), in listing order
+        """
+        tag_postings = self.tag_postings.get()
+        postings = [tag_postings['postings'].get(tag, []) for tag in tags]
+
+        if match_all:
+            positions = set(postings[0]).intersection(*postings[1:])
+        else:
+            positions = set().union(*postings)
+
+        return [tag_postings['page_ids'][position] for position in sorted(positions)]
+
+    def paginate_tagged_pages(self, request, per_page, prefetch=None):
+        """
+        Returns the page of tagged_pages asked for by the request, filtered by
+        its tag parameters. With more than one tag, pages must have all of
+        them unless match=any is given. The total comes from the tag postings
+        so the listing is never counted in the database
+        """
+        pages = self.tagged_pages
+
+        # A blank tag (?tag=) means no filter
+        tags = [tag for tag in request.GET.getlist('tag') if tag]
+        if tags:
+            page_ids = self.get_tagged_page_ids(tags, match_all=request.GET.get('match') != 'any')
+            pages = pages.filter(id__in=page_ids)
+        else:
+            page_ids = self.tag_postings.get()['page_ids']
+
+        paginator = KeysetPaginator(pages, per_page, self.listing_ordering, count=len(page_ids), prefetch=prefetch)
+        return paginator.page_for_request(request)
+
+
+# Ids of the tagged pages being saved in this thread (see TaggedPageMixin)
+_saving_pages = threading.local()
+
+
+def get_saving_pages():
+    if not hasattr(_saving_pages, 'ids'):
+        _saving_pages.ids = set()
+    return _saving_pages.ids
+
+
+# Sent once a tagged page has been saved along with its tags
+tagged_page_saved = Signal(providing_args=['instance'])
+
+
+class TaggedPageMixin(object):
+    """
+    For pages whose tags are counted by the index pages above them (see
+    TaggedIndexMixin). Saving one saves each of its tags after the page, so
+    the tags aren't recounted one at a time while the page is being saved
+    (see signal_handlers.tag_select_changed). tagged_page_saved is sent
+    once it has been saved instead, so they are recounted together.
+    """
+    def save(self, *args, **kwargs):
+        saving = get_saving_pages()
+        marked = self.id is not None and self.id not in saving
+        if marked:
+            saving.add(self.id)
+
+        try:
+            result = super(TaggedPageMixin, self).save(*args, **kwargs)
+        finally:
+            if marked:
+                saving.discard(self.id)
+
+        # Saving new revisions only updates a few fields, which aren't counted
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & set(['live', 'tags']):
+            tagged_page_saved.send(sender=type(self), instance=self)
+
+        return result
+
+
 # Blog index page
 
 class BlogIndexPageRelatedLink(Orderable, RelatedLink):
     page = ParentalKey('torchbox.BlogIndexPage', related_name='related_links')
 
 
-class BlogIndexPage(Page):
+class BlogIndexPage(TaggedIndexMixin, Page):
     intro = RichTextField(blank=True)
 
+    # Most recent first, newest post first on the same day
+    listing_ordering = ('-date', '-id')
+
     indexed_fields = ('intro', )
     search_name = "Blog"
 
     show_in_play_menu = models.BooleanField(default=False)
 
-    def get_popular_tags(self):
-        # Get a ValuesQuerySet of tags ordered by most popular
-        popular_tags = BlogPageTagSelect.objects.all().values('tag').annotate(item_count=models.Count('tag')).order_by('-item_count')
+    @property
+    def tag_select_model(self):
+        return BlogPageTagSelect
 
-        # Return first 10 popular tags as tag objects
-        # Getting them individually to preserve the order
-        return [BlogPageTagList.objects.get(id=tag['tag']) for tag in popular_tags[:10]]
+    @property
+    def tagged_pages(self):
+        return self.blog_posts
 
     @property
     def blog_posts(self):
@@ -452,42 +795,62 @@ class BlogIndexPage(Page):
         )
 
         # Order by most recent date first
-        blog_posts = blog_posts.order_by('-date')
+        blog_posts = blog_posts.order_by(*self.listing_ordering)
 
         return blog_posts
 
-    def serve(self, request):
-        # Get blog_posts
-        blog_posts = self.blog_posts
-
-        # Filter by tag
-        tag = request.GET.get('tag')
-        if tag:
-            blog_posts = blog_posts.filter(tags__tag__slug=tag)
+    def serve_listing(self, request, per_page):
+        """
+        Renders the blog listing for ajax paging. The ETag and the cached
+        fragment are keyed by what the listing shows: the query parameters
+        (which its links keep), where the page is in the listing, and the
+        posts on it with everything the template shows of them. So they're
+        the same on every web host, and change as soon as the content does
+        """
+        # The listing doesn't show the posts' images, so nothing needs
+        # prefetching
+        blog_posts = self.paginate_tagged_pages(request, per_page)
+        etag = hashlib.md5(force_bytes(repr((
+            self.id, sorted(request.GET.lists()), per_page,
+            blog_posts.number, blog_posts.has_previous(), blog_posts.has_next(), blog_posts.paginator.num_pages,
+            [
+                (post.id, post.url, post.title, post.intro, post.date, post.author_left, post.authors)
+                for post in blog_posts
+            ],
+        )))).hexdigest()
+
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            cache_key = 'blog_listing:%s' % etag
+            content = cache.get(cache_key)
+            if content is None:
+                content = render_to_string("torchbox/includes/blog_listing.html", {
+                    'self': self,
+                    'blog_posts': blog_posts,
+                    'per_page': per_page,
+                }, RequestContext(request))
+                cache.set(cache_key, content, 60 * 60)
+            response = HttpResponse(content)
+
+        response['ETag'] = quote_etag(etag)
+        patch_vary_headers(response, ['X-Requested-With'])
+        return response
 
-        # Pagination
+    def serve(self, request):
         per_page = 10
-        page = request.GET.get('page')
-        paginator = Paginator(blog_posts, per_page)  # Show 10 blog_posts per page
-        try:
-            blog_posts = paginator.page(page)
-        except PageNotAnInteger:
-            blog_posts = paginator.page(1)
-        except EmptyPage:
-            blog_posts = paginator.page(paginator.num_pages)
 
         if request.is_ajax():
-            return render(request, "torchbox/includes/blog_listing.html", {
-                'self': self,
-                'blog_posts': blog_posts,
-                'per_page': per_page,
-            })
-        else:
-            return render(request, self.template, {
-                'self': self,
-                'blog_posts': blog_posts,
-                'per_page': per_page,
-            })
+            return self.serve_listing(request, per_page)
+
+        # Get blog_posts, filtered by tag and paginated
+        blog_posts = self.paginate_tagged_pages(request, per_page, BLOG_POST_PREFETCH)
+
+        return render(request, self.template, {
+            'self': self,
+            'blog_posts': blog_posts,
+            'per_page': per_page,
+        })
 
 
 BlogIndexPage.content_panels = [
@@ -502,6 +865,79 @@ BlogIndexPage.promote_panels = [
 ]
 
 
+# Author summaries for blog and work pages
+class AuthorSummaryMixin(object):
+    """
+    Keeps a summary of the people in a page's related_author, so they can be
+    shown without any queries. author_summary is a JSON list with the id,
+    title, role, url and avatar (the fill-300x300 rendition of their image,
+    with its alt text) of each person. It is updated when the page is
+    published, and when one of the people or their image changes (see
+    signal_handlers.py)
+    """
+    def build_author_summary(self):
+        authors = []
+        for related_author in self.related_author.all():
+            person = related_author.author
+            if person is None:
+                continue
+
+            avatar = None
+            if person.image:
+                try:
+                    rendition = person.image.get_rendition('fill-300x300')
+                except SourceImageIOError:
+                    pass
+                else:
+                    avatar = {
+                        'url': rendition.url,
+                        'width': rendition.width,
+                        'height': rendition.height,
+                        'alt': person.image.title,
+                    }
+
+            authors.append({
+                'id': person.id,
+                'title': person.title,
+                'role': person.role,
+                'url': get_page_url(person.id, person.url_path),
+                'avatar': avatar,
+            })
+        return authors
+
+    def update_author_summary(self):
+        self.author_summary = json.dumps(self.build_author_summary())
+        self.__dict__.pop('authors', None)
+
+        # Saving the whole page would create a new version of it in the
+        # search index, and so on
+        type(self).objects.filter(id=self.id).update(author_summary=self.author_summary)
+
+    @cached_property
+    def authors(self):
+        if self.author_summary is None:
+            # Migration 0017 couldn't summarise the page's authors. The
+            # summary is saved when the page is next published; page views
+            # don't write to the database
+            authors = self.build_author_summary()
+        else:
+            authors = json.loads(self.author_summary)
+
+        record_pages(author['id'] for author in authors)
+        return authors
+
+    @property
+    def has_authors(self):
+        return bool(self.authors)
+
+    def serve_preview(self, request, mode_name):
+        # The summary is only updated on publish, so show the people that
+        # are in the preview
+        self.author_summary = json.dumps(self.build_author_summary())
+        self.__dict__.pop('authors', None)
+        return super(AuthorSummaryMixin, self).serve_preview(request, mode_name)
+
+
 # Blog page
 class BlogPageRelatedLink(Orderable, RelatedLink):
     page = ParentalKey('torchbox.BlogPage', related_name='related_links')
@@ -527,6 +963,24 @@ BlogPageTagSelect.content_panels = [
 ]
 
 
+class IndexPageTagCount(models.Model):
+    """
+    The number of live pages below an index page that use a tag. See
+    TaggedIndexMixin.
+    """
+    index = models.ForeignKey('wagtailcore.Page', related_name='+')
+    tag = models.ForeignKey('torchbox.BlogPageTagList', related_name='+')
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = (
+            ('index', 'tag'),
+        )
+        index_together = (
+            ('index', 'count'),
+        )
+
+
 class BlogPageAuthor(Orderable):
     page = ParentalKey('torchbox.BlogPage', related_name='related_author')
     author = models.ForeignKey(
@@ -541,11 +995,12 @@ class BlogPageAuthor(Orderable):
     ]
 
 
-class BlogPage(Page):
+class BlogPage(TaggedPageMixin, AuthorSummaryMixin, Page):
     intro = RichTextField("Intro (used only for blog index listing)", blank=True)
     body = RichTextField("body (deprecated. Use streamfield instead)", blank=True)
     streamfield = StreamField(StoryBlock())
     author_left = models.CharField(max_length=255, blank=True, help_text='author who has left Torchbox')
+    author_summary = models.TextField(null=True, editable=False)
     date = models.DateField("Post date")
     feed_image = models.ForeignKey(
         'torchbox.TorchboxImage',
@@ -558,22 +1013,17 @@ class BlogPage(Page):
     indexed_fields = ('body', )
     search_name = "Blog Entry"
 
-    @property
+    @cached_property
     def blog_index(self):
-        # Find blog index in ancestors
-        for ancestor in reversed(self.get_ancestors()):
-            if isinstance(ancestor.specific, BlogIndexPage):
-                return ancestor
+        return find_index_page(BlogIndexPage, self.path)
 
-        # No ancestors are blog indexes,
-        # just return first blog index in database
-        return BlogIndexPage.objects.first()
-
-    @property
-    def has_authors(self):
-        for author in self.related_author.all():
-            if author.author:
-                return True
+    def get_neighbours(self):
+        """
+        Returns the live blog posts either side of this one in (date, id)
+        order, as (previous, next) BlogNeighbours. Either may be None. Works
+        for posts that aren't live too, such as previews.
+        """
+        return find_neighbours(blog_chain.get(), (self.date, self.id))
 
 BlogPage.content_panels = [
     FieldPanel('title', classname="full title"),
@@ -593,6 +1043,44 @@ BlogPage.promote_panels = [
 ]
 
 
+# A lightweight stand-in for a BlogPage in next/previous links
+BlogNeighbour = namedtuple('BlogNeighbour', ['id', 'title', 'url'])
+
+
+def find_neighbours(chain, key):
+    """
+    Returns the items either side of a key in a chain (a dict of sorted
+    'keys' and the 'items' they belong to) as a (previous, next) tuple.
+    Either may be None. The key doesn't need to be in the chain. The items
+    must have an id, and are recorded as pages the caller shows.
+    """
+    previous_index = bisect_left(chain['keys'], key) - 1
+    next_index = bisect_right(chain['keys'], key)
+
+    neighbours = (
+        chain['items'][previous_index] if previous_index >= 0 else None,
+        chain['items'][next_index] if next_index < len(chain['items']) else None,
+    )
+    record_pages(neighbour.id for neighbour in neighbours if neighbour)
+    return neighbours
+
+
+def build_blog_chain():
+    posts = BlogPage.objects.live().order_by('date', 'id').values_list('id', 'title', 'url_path', 'date')
+
+    chain = {'keys': [], 'items': []}
+    for page_id, title, url_path, post_date in posts:
+        chain['keys'].append((post_date, page_id))
+        chain['items'].append(BlogNeighbour(page_id, title, get_page_url(page_id, url_path)))
+    return chain
+
+
+# Every live blog post in (date, id) order, for next/previous links. Rebuilt
+# whenever a page is published, unpublished, moved or deleted (see
+# signal_handlers.py)
+blog_chain = Snapshot('blog_chain', build_blog_chain)
+
+
 # Jobs index page
 class JobIndexPageContentBlock(Orderable, ContentBlock):
     page = ParentalKey('torchbox.JobIndexPage', related_name='content_block')
@@ -611,6 +1099,10 @@ class JobIndexPageJob(Orderable):
     ]
 
 
+# A lightweight stand-in for a JobIndexPageJob in job listings
+JobListing = namedtuple('JobListing', ['title', 'url', 'location'])
+
+
 class JobIndexPage(Page):
     intro = RichTextField(blank=True)
 
@@ -622,25 +1114,46 @@ class JobIndexPage(Page):
 
         return jobs
 
-    def serve(self, request):
-        # Get jobs
-        jobs = self.jobs
-
-        # Pagination
-        page = request.GET.get('page')
-        paginator = Paginator(jobs, 10)  # Show 10 jobs per page
-        try:
-            jobs = paginator.page(page)
-        except PageNotAnInteger:
-            jobs = paginator.page(1)
-        except EmptyPage:
-            jobs = paginator.page(paginator.num_pages)
+    @cached_property
+    def job_listing(self):
+        """
+        The page's jobs as JobListings, from the job_listings snapshot
+        """
+        return job_listings.get()['jobs'].get(self.id, [])
 
+    def serve(self, request):
         return render(request, self.template, {
             'self': self,
-            'jobs': jobs,
+            'jobs': self.job_listing,
         })
 
+    def serve_preview(self, request, mode_name):
+        # The snapshot only has published jobs, so show the ones in the preview
+        self.job_listing = [JobListing(job.job_title, job.url, job.location) for job in self.jobs]
+        return super(JobIndexPage, self).serve_preview(request, mode_name)
+
+
+def build_job_listings():
+    index_ids = list(JobIndexPage.objects.live().order_by('path').values_list('id', flat=True))
+
+    jobs = {}
+    job_rows = JobIndexPageJob.objects.filter(page__in=index_ids).order_by('sort_order', 'id').values_list(
+        'page_id', 'job_title', 'url', 'location'
+    )
+    for page_id, title, url, location in job_rows:
+        jobs.setdefault(page_id, []).append(JobListing(title, url, location))
+
+    return {
+        # The job index the homepage lists jobs from
+        'first': index_ids[0] if index_ids else None,
+        'jobs': jobs,
+    }
+
+
+# The jobs of every live job index page, by page id. Rebuilt whenever a job
+# index page is published, unpublished or deleted (see signal_handlers.py)
+job_listings = Snapshot('job_listings', build_job_listings)
+
 
 JobIndexPage.content_panels = [
     FieldPanel('title', classname="full title"),
@@ -696,8 +1209,9 @@ class WorkPageAuthor(Orderable):
     ]
 
 
-class WorkPage(Page):
+class WorkPage(TaggedPageMixin, AuthorSummaryMixin, Page):
     author_left = models.CharField(max_length=255, blank=True, help_text='author who has left Torchbox')
+    author_summary = models.TextField(null=True, editable=False)
     summary = models.CharField(max_length=255)
     intro = RichTextField("Intro (deprecated. Use streamfield instead)", blank=True)
     body = RichTextField("Body (deprecated. Use streamfield instead)", blank=True)
@@ -713,22 +1227,20 @@ class WorkPage(Page):
 
     show_in_play_menu = models.BooleanField(default=False)
 
-    @property
+    @cached_property
     def work_index(self):
-        # Find work index in ancestors
-        for ancestor in reversed(self.get_ancestors()):
-            if isinstance(ancestor.specific, WorkIndexPage):
-                return ancestor
+        return find_index_page(WorkIndexPage, self.path)
 
-        # No ancestors are work indexes,
-        # just return first work index in database
-        return WorkIndexPage.objects.first()
+    def get_neighbours(self):
+        """
+        Returns the live pages either side of this one among its siblings,
+        in tree order, as (previous, next) WorkNeighbours. Either may be None.
+        """
+        chain = work_siblings.get().get(self.path[:-self.steplen])
+        if chain is None:
+            return None, None
 
-    @property
-    def has_authors(self):
-        for author in self.related_author.all():
-            if author.author:
-                return True
+        return find_neighbours(chain, self.path)
 
 WorkPage.content_panels = [
     FieldPanel('title', classname="full title"),
@@ -749,20 +1261,70 @@ WorkPage.promote_panels = [
 ]
 
 
+# A lightweight stand-in for a sibling of a WorkPage in next/previous links.
+# 'thumbnail' is the fill-80x80 rendition of its homepage image, if it has one
+WorkNeighbour = namedtuple('WorkNeighbour', ['id', 'title', 'url', 'thumbnail'])
+WorkThumbnail = namedtuple('WorkThumbnail', ['url', 'width', 'height', 'alt'])
+
+
+def build_work_siblings():
+    work_pages = dict(
+        (page.id, page) for page in WorkPage.objects.live().select_related('homepage_image')
+    )
+    if not work_pages:
+        return {}
+
+    resolve_renditions([(page.homepage_image, 'fill-80x80') for page in work_pages.values()])
+
+    # All the live children of the pages that have work pages under them
+    parent_paths = set(page.path[:-Page.steplen] for page in work_pages.values())
+    children_q = models.Q()
+    for path in parent_paths:
+        children_q |= models.Q(path__startswith=path, depth=len(path) // Page.steplen + 1)
+    siblings = Page.objects.live().filter(children_q).order_by('path').values_list('id', 'title', 'url_path', 'path')
+
+    chains = dict((path, {'keys': [], 'items': []}) for path in parent_paths)
+    for page_id, title, url_path, path in siblings:
+        thumbnail = None
+        image = work_pages[page_id].homepage_image if page_id in work_pages else None
+        if image:
+            try:
+                rendition = image.get_rendition('fill-80x80')
+            except SourceImageIOError:
+                pass
+            else:
+                thumbnail = WorkThumbnail(rendition.url, rendition.width, rendition.height, image.title)
+
+        chain = chains[path[:-Page.steplen]]
+        chain['keys'].append(path)
+        chain['items'].append(WorkNeighbour(page_id, title, get_page_url(page_id, url_path), thumbnail))
+
+    return chains
+
+
+# The live siblings of every work page in tree order, by their parent's path.
+# Rebuilt whenever a page is published, unpublished, moved or deleted, or an
+# image is changed (see signal_handlers.py)
+work_siblings = Snapshot('work_siblings', build_work_siblings)
+
+
 # Work index page
-class WorkIndexPage(Page):
+class WorkIndexPage(TaggedIndexMixin, Page):
     intro = RichTextField(blank=True)
 
     show_in_play_menu = models.BooleanField(default=False)
     hide_popular_tags = models.BooleanField(default=False)
 
-    def get_popular_tags(self):
-        # Get a ValuesQuerySet of tags ordered by most popular
-        popular_tags = WorkPageTagSelect.objects.all().values('tag').annotate(item_count=models.Count('tag')).order_by('-item_count')
+    # Tree order, as in the admin
+    listing_ordering = ('path', )
 
-        # Return first 10 popular tags as tag objects
-        # Getting them individually to preserve the order
-        return [BlogPageTagList.objects.get(id=tag['tag']) for tag in popular_tags[:10]]
+    @property
+    def tag_select_model(self):
+        return WorkPageTagSelect
+
+    @property
+    def tagged_pages(self):
+        return self.works
 
     @property
     def works(self):
@@ -770,28 +1332,13 @@ class WorkIndexPage(Page):
         works = WorkPage.objects.filter(
             live=True,
             path__startswith=self.path
-        )
+        ).order_by(*self.listing_ordering)
 
         return works
 
     def serve(self, request):
-        # Get work pages
-        works = self.works
-
-        # Filter by tag
-        tag = request.GET.get('tag')
-        if tag:
-            works = works.filter(tags__tag__slug=tag)
-
-        # Pagination
-        page = request.GET.get('page')
-        paginator = Paginator(works, 10)  # Show 10 works per page
-        try:
-            works = paginator.page(page)
-        except PageNotAnInteger:
-            works = paginator.page(1)
-        except EmptyPage:
-            works = paginator.page(paginator.num_pages)
+        # Get work pages, filtered by tag and paginated
+        works = self.paginate_tagged_pages(request, 10, WORK_INDEX_PREFETCH)  # Show 10 works per page
 
         return render(request, self.template, {
             'self': self,
@@ -811,6 +1358,51 @@ WorkIndexPage.promote_panels = [
 ]
 
 
+# Index page lookups for blog and work pages
+
+INDEX_PAGE_MODELS = (BlogIndexPage, WorkIndexPage)
+
+
+def build_index_pages():
+    index_pages = {}
+    for model in INDEX_PAGE_MODELS:
+        pages = model.objects.order_by('id').values_list('id', 'title', 'path', 'depth', 'url_path')
+        index_pages[model.__name__] = {
+            'by_path': dict((page[2], page) for page in pages),
+            'first': pages[0] if pages else None,
+        }
+    return index_pages
+
+
+# The blog and work index pages by tree path. Rebuilt whenever a page is
+# published, unpublished, moved or deleted (see signal_handlers.py)
+index_pages = Snapshot('index_pages', build_index_pages)
+
+
+def find_index_page(model, path):
+    """
+    Returns the nearest ancestor of the page with the given path that is a
+    model (one of INDEX_PAGE_MODELS) page, or the first one in the database
+    if none are. This is an unsaved stand-in with just the id, title, path,
+    depth and url_path, which is enough for pageurl.
+    """
+    pages = index_pages.get()[model.__name__]
+
+    for ancestor_path in reversed(get_ancestor_paths(path)):
+        if ancestor_path in pages['by_path']:
+            page = pages['by_path'][ancestor_path]
+            break
+    else:
+        page = pages['first']
+
+    if page is not None:
+        page_id, title, path, depth, url_path = page
+        with paused():
+            page = model(id=page_id, title=title, path=path, depth=depth, url_path=url_path)
+        record_pages([page_id])
+        return page
+
+
 # Person page
 class PersonPageRelatedLink(Orderable, RelatedLink):
     page = ParentalKey('torchbox.PersonPage', related_name='related_links')
@@ -858,6 +1450,16 @@ PersonPage.promote_panels = [
 ]
 
 
+# Picks people for the home page from the live people outside Play. The pool
+# is rebuilt whenever a page is published, unpublished, moved or deleted (see
+# signal_handlers.py)
+people_sampler = Sampler(
+    'people',
+    lambda: play_filter(PersonPage.objects.live()),
+    rotation_setting='HOMEPAGE_PEOPLE_ROTATION'
+)
+
+
 # Person index
 class PersonIndexPage(Page):
     intro = RichTextField(blank=True)
@@ -874,25 +1476,6 @@ class PersonIndexPage(Page):
 
         return people
 
-    def serve(self, request):
-        # Get people
-        people = self.people
-
-        # Pagination
-        page = request.GET.get('page')
-        paginator = Paginator(people, 10)  # Show 10 jobs per page
-        try:
-            people = paginator.page(page)
-        except PageNotAnInteger:
-            people = paginator.page(1)
-        except EmptyPage:
-            people = paginator.page(paginator.num_pages)
-
-        return render(request, self.template, {
-            'self': self,
-            'people': people,
-        })
-
 
 PersonIndexPage.content_panels = [
     FieldPanel('title', classname="full title"),
@@ -0,0 +1,215 @@
+import json
+
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class CursorSerializer(object):
+    # Like signing.JSONSerializer, but allows dates in cursors
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), cls=DjangoJSONEncoder).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+def dump_cursor(number, keys):
+    return signing.dumps({'n': number, 'k': keys}, salt='tbx.core.pagination', serializer=CursorSerializer)
+
+
+def load_cursor(token):
+    """
+    Returns the page number and ordering values in a cursor token, or None if
+    the token is not valid
+    """
+    try:
+        cursor = signing.loads(token, salt='tbx.core.pagination', serializer=CursorSerializer)
+        return max(int(cursor['n']), 1), list(cursor['k'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+
+def seek_q(ordering, keys, forwards=True):
+    """
+    Returns a Q matching the rows that come after (or before, if forwards is
+    False) the row with the given ordering values
+    """
+    q = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') == forwards else 'gt'
+
+        clause = Q(**{'%s__%s' % (name, lookup): keys[i]})
+        for previous_field, previous_key in zip(ordering[:i], keys[:i]):
+            clause &= Q(**{previous_field.lstrip('-'): previous_key})
+
+        q |= clause
+    return q
+
+
+def reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else '-' + field for field in ordering]
+
+
+class KeysetPaginator(object):
+    """
+    Paginates a queryset by seeking past the last row of the previous page,
+    rather than with an OFFSET. Links between pages carry opaque ?after= and
+    ?before= cursor tokens. ?page=N is still understood, so old links work.
+
+    The ordering must be unique across the queryset (end it with id or path).
+    Pass count if the total is already known, otherwise the queryset is only
+    counted if num_pages is used. Pass a ListingPrefetch as prefetch to load
+    what the listing template needs along with each page.
+    """
+    def __init__(self, object_list, per_page, ordering, count=None, prefetch=None):
+        self.ordering = list(ordering)
+        self.object_list = object_list.order_by(*self.ordering)
+        self.per_page = per_page
+        self.prefetch = prefetch
+        if prefetch is not None:
+            self.object_list = prefetch.prepare(self.object_list)
+        if count is not None:
+            self.count = count
+
+    @cached_property
+    def count(self):
+        return self.object_list.count()
+
+    @property
+    def num_pages(self):
+        return max((self.count + self.per_page - 1) // self.per_page, 1)
+
+    def get_keys(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def page_for_request(self, request):
+        """
+        Returns the page asked for by the after, before or page parameters in
+        the request. Bad parameters give the first page
+        """
+        params = request.GET.copy()
+        for key in ('page', 'after', 'before'):
+            params.pop(key, None)
+
+        for key in ('after', 'before'):
+            cursor = load_cursor(request.GET.get(key, ''))
+            if cursor is not None:
+                number, keys = cursor
+                if len(keys) == len(self.ordering):
+                    return KeysetPage(self, number, params, **{key: keys})
+
+        try:
+            number = max(int(request.GET.get('page')), 1)
+        except (TypeError, ValueError):
+            number = 1
+
+        return KeysetPage(self, number, params)
+
+
+class KeysetPage(object):
+    """
+    A page from a KeysetPaginator. Has the parts of Django's Page that the
+    templates use, plus next_params and previous_params: query strings for
+    the neighbouring pages that keep any other parameters (such as tags).
+    The rows are not fetched until they are needed
+    """
+    def __init__(self, paginator, number, params, after=None, before=None):
+        self.paginator = paginator
+        self._number = number
+        self.params = params
+        self.after = after
+        self.before = before
+
+    def fetch(self, retry=True):
+        paginator = self.paginator
+        per_page = paginator.per_page
+
+        if self.after is not None:
+            rows = list(paginator.object_list.filter(
+                seek_q(paginator.ordering, self.after)
+            )[:per_page + 1])
+            self._has_next = len(rows) > per_page
+            self._has_previous = True
+            rows = rows[:per_page]
+        elif self.before is not None:
+            rows = list(paginator.object_list.filter(
+                seek_q(paginator.ordering, self.before, forwards=False)
+            ).order_by(*reverse_ordering(paginator.ordering))[:per_page + 1])
+            self._has_next = True
+            self._has_previous = len(rows) > per_page
+            rows = rows[:per_page][::-1]
+            if not self._has_previous:
+                self._number = 1
+        else:
+            offset = (self._number - 1) * per_page
+            rows = list(paginator.object_list[offset:offset + per_page + 1])
+            self._has_next = len(rows) > per_page
+            self._has_previous = self._number > 1
+            rows = rows[:per_page]
+
+        if not rows and retry and (self.after is not None or self.before is not None or self._number > 1):
+            # The cursor or page number is past the end, probably because
+            # pages have been removed. Show the last page instead, like
+            # Django's paginator does, or the first if the count is stale
+            self.after = self.before = None
+            self._number = paginator.num_pages
+            rows = self.fetch(retry=False)
+            if not rows and self._number > 1:
+                self._number = 1
+                rows = self.fetch(retry=False)
+
+        return rows
+
+    @cached_property
+    def object_list(self):
+        rows = self.fetch()
+        if self.paginator.prefetch is not None:
+            self.paginator.prefetch.load_renditions(rows)
+        return rows
+
+    @property
+    def number(self):
+        # Fetching the rows can change the page number
+        self.object_list
+        return self._number
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        self.object_list
+        return self._has_next
+
+    def has_previous(self):
+        self.object_list
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def get_params(self, key, number, obj):
+        params = self.params.copy()
+        params[key] = dump_cursor(number, self.paginator.get_keys(obj))
+        return params.urlencode()
+
+    @property
+    def next_params(self):
+        if self.has_next():
+            return self.get_params('after', self.next_page_number(), self.object_list[-1])
+
+    @property
+    def previous_params(self):
+        if self.has_previous():
+            return self.get_params('before', self.previous_page_number(), self.object_list[0])
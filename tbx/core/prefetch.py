@@ -0,0 +1,233 @@
+import logging
+
+from wagtail.wagtailimages.models import Filter, SourceImageIOError
+
+from tbx.core.images import get_responsive_specs
+from tbx.core.rendition_cache import cache_rendition, get_cached_renditions
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_related(objects, path):
+    """
+    Follows a double-underscore path (as used by prefetch_related) from each
+    of the objects, returning everything at the end of it. Relations that
+    were prefetched are followed without queries
+    """
+    for name in path.split('__'):
+        related = []
+        for obj in objects:
+            value = getattr(obj, name, None)
+            if hasattr(value, 'all'):
+                related.extend(value.all())
+            elif value is not None:
+                related.append(value)
+        objects = related
+    return objects
+
+
+def resolve_renditions(images, create=True):
+    """
+    Fetches the renditions for a list of (image, filter spec) pairs, taking
+    the ones that have been used before from the rendition cache, loading the
+    other existing ones in one query and creating only the missing ones. They
+    are kept on the images so that get_rendition (and so the image tag)
+    returns them without looking them up again.
+
+    With create=False, missing renditions are kept as None rather than
+    created, for the responsive_image tag to leave out.
+
+    Returns the number of renditions that had to be created (or are missing,
+    with create=False).
+    """
+    images = [(image, spec) for image, spec in images if image is not None]
+    if not images:
+        return 0
+
+    def keep(image, spec, rendition):
+        if not hasattr(image, 'prefetched_renditions'):
+            image.prefetched_renditions = {}
+        image.prefetched_renditions[spec] = rendition
+
+    cached = get_cached_renditions(images)
+    for image, spec in images:
+        if (image.id, spec) in cached:
+            keep(image, spec, cached[image.id, spec])
+
+    images = [(image, spec) for image, spec in images if (image.id, spec) not in cached]
+    if not images:
+        return 0
+
+    specs = set(spec for image, spec in images)
+    filters = dict((filter.spec, filter) for filter in Filter.objects.filter(spec__in=specs))
+    if create:
+        for spec in specs.difference(filters):
+            filters[spec], created = Filter.objects.get_or_create(spec=spec)
+
+    Rendition = images[0][0].renditions.model
+    renditions = dict(
+        ((rendition.image_id, rendition.filter_id, rendition.focal_point_key), rendition)
+        for rendition in Rendition.objects.filter(
+            image_id__in=set(image.id for image, spec in images),
+            filter__in=filters.values()
+        )
+    )
+
+    created = 0
+    for image, spec in images:
+        filter = filters.get(spec)
+        rendition = None
+        if filter is not None:
+            rendition = renditions.get((image.id, filter.id, filter.get_cache_key(image)))
+
+        if rendition is None:
+            if not create:
+                created += 1
+                keep(image, spec, None)
+                continue
+
+            try:
+                rendition = image.get_rendition(filter)
+            except SourceImageIOError:
+                # Leave it to the image tag to deal with
+                continue
+            except Exception:
+                # Most likely a format this build of Pillow can't save, such
+                # as WebP. That shouldn't stop the image's other renditions
+                logger.exception("Couldn't create the %s rendition of image %d", spec, image.id)
+                continue
+
+            # Display renditions of small images are the original file,
+            # rather than a new rendition
+            if rendition.pk is not None:
+                created += 1
+        else:
+            cache_rendition(image, spec, rendition)
+
+        keep(image, spec, rendition)
+
+    return created
+
+
+def resolve_responsive_renditions(images):
+    """
+    Fetches the renditions for a list of (image, filter spec) pairs that are
+    shown with the responsive_image tag. Each filter spec's rendition is
+    created if it's missing, but its responsive and WebP variants are only
+    loaded if they already exist; they are generated in the background.
+    """
+    resolve_renditions(images)
+    resolve_renditions([
+        (image, variant)
+        for image, spec in images
+        for variant in get_responsive_specs(spec)
+        if variant != spec
+    ], create=False)
+
+
+def get_stream_renditions(stream):
+    """
+    Returns the (image, filter spec) pairs used to show a StreamField in
+    includes/streamfield.html, for resolve_responsive_renditions
+    """
+    images = []
+    for child in stream:
+        if child.block_type == 'bustout':
+            images.append((child.value['image'], 'width-1280'))
+        elif child.block_type == 'aligned_image':
+            if child.value['alignment'] in ('left', 'right'):
+                images.append((child.value['image'], 'width-400'))
+            elif child.value['alignment'] == 'half':
+                images.append((child.value['image'], 'width-800'))
+            else:
+                images.append((child.value['image'], 'width-1280'))
+
+    return images
+
+
+class ListingPrefetch(object):
+    """
+    Loads everything a listing template needs for a queryset of pages in a
+    fixed number of queries, however many pages there are: related objects
+    through select_related and prefetch_related, then the renditions of
+    their images (apart from any that have to be created).
+
+    renditions is a list of (path, filter spec) pairs, where path leads from
+    a page to an image in the same way as a prefetch_related lookup, or is a
+    function that takes a page and returns an image (or None). The filter
+    specs need to match the image tags in the templates.
+    responsive_renditions is the same for images shown with the
+    responsive_image tag (see resolve_responsive_renditions).
+    """
+    def __init__(self, select_related=(), prefetch_related=(), renditions=(), responsive_renditions=()):
+        self.select_related = select_related
+        self.prefetch_related = prefetch_related
+        self.renditions = renditions
+        self.responsive_renditions = responsive_renditions
+
+    def prepare(self, queryset):
+        return queryset.select_related(*self.select_related).prefetch_related(*self.prefetch_related)
+
+    def get_images(self, objects, path):
+        if callable(path):
+            return [path(obj) for obj in objects]
+        return get_related(objects, path)
+
+    def load_renditions(self, objects):
+        resolve_renditions([
+            (image, spec)
+            for path, spec in self.renditions
+            for image in self.get_images(objects, path)
+        ])
+        resolve_responsive_renditions([
+            (image, spec)
+            for path, spec in self.responsive_renditions
+            for image in self.get_images(objects, path)
+        ])
+
+    def __call__(self, queryset):
+        objects = list(self.prepare(queryset))
+        self.load_renditions(objects)
+        return objects
+
+
+# For blog_list_item.html and blog_listing.html. Authors come from BlogPage.author_summary
+BLOG_POST_PREFETCH = ListingPrefetch(
+    select_related=['feed_image'],
+    responsive_renditions=[
+        ('feed_image', 'fill-764x448'),
+    ],
+)
+
+
+# For work_list_item.html
+WORK_PREFETCH = ListingPrefetch(
+    select_related=['homepage_image'],
+    responsive_renditions=[
+        ('homepage_image', 'fill-764x448'),
+    ],
+)
+
+
+def get_first_screenshot_image(work):
+    screenshot = next(iter(work.screenshots.all()), None)
+    return screenshot.image if screenshot else None
+
+
+# For work_index_page.html, which only shows each page's first screenshot
+WORK_INDEX_PREFETCH = ListingPrefetch(
+    prefetch_related=['screenshots__image'],
+    renditions=[
+        (get_first_screenshot_image, 'width-2000'),
+    ],
+)
+
+
+# For homepage_people_listing.html
+PERSON_PREFETCH = ListingPrefetch(
+    select_related=['image'],
+    renditions=[
+        ('image', 'width-300'),
+    ],
+)
@@ -0,0 +1,104 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class LRUCache(object):
+    """
+    A dict that only keeps the most recently used items, up to a size. Safe
+    to use from several threads.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.values = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.values.pop(key, None)
+            if value is not None:
+                # Move it to the most recently used end
+                self.values[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.values.pop(key, None)
+            self.values[key] = value
+            while len(self.values) > self.size:
+                self.values.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+# The (file name, width, height) of renditions used recently in this process,
+# in front of the shared cache
+_local = LRUCache(getattr(settings, 'RENDITION_CACHE_SIZE', 1000))
+
+
+def get_image_version(image):
+    # Changes whenever the image's file or focal point does, which covers
+    # everything a rendition depends on (including its focal point key), so
+    # renditions of an image that has changed are never found in the cache
+    version = '%s:%s:%s:%s:%s' % (
+        image.file.name, image.focal_point_x, image.focal_point_y,
+        image.focal_point_width, image.focal_point_height
+    )
+    return hashlib.md5(version.encode('utf-8')).hexdigest()[:8]
+
+
+def get_key(image, filter_spec):
+    return 'rendition:%d:%s:%s' % (image.id, get_image_version(image), '.'.join(filter_spec.split()))
+
+
+def make_rendition(image, value):
+    # An unsaved rendition, which has everything the templates use
+    name, width, height = value
+    rendition = image.renditions.model(image=image, width=width, height=height)
+    rendition.file.name = name
+    return rendition
+
+
+def get_cached_renditions(images):
+    """
+    Looks up a list of (image, filter spec) pairs in the process's LRU cache,
+    then the rest of them in the Django cache, all at once. Returns the
+    renditions that were found, keyed by (image id, filter spec).
+    """
+    keys = {}
+    found = {}
+    for image, spec in images:
+        key = get_key(image, spec)
+        value = _local.get(key)
+        if value is not None:
+            found[image.id, spec] = make_rendition(image, value)
+        else:
+            keys[key] = (image, spec)
+
+    if keys:
+        for key, value in cache.get_many(list(keys)).items():
+            image, spec = keys[key]
+            _local.set(key, value)
+            found[image.id, spec] = make_rendition(image, value)
+
+    return found
+
+
+def get_cached_rendition(image, filter_spec):
+    return get_cached_renditions([(image, filter_spec)]).get((image.id, filter_spec))
+
+
+def cache_rendition(image, filter_spec, rendition):
+    if rendition.pk is None:
+        # Not a real rendition
+        return
+
+    key = get_key(image, filter_spec)
+    value = (rendition.file.name, rendition.width, rendition.height)
+    _local.set(key, value)
+    cache.set(key, value, getattr(settings, 'RENDITION_CACHE_TIMEOUT', 60 * 60 * 24 * 7))
@@ -0,0 +1,94 @@
+import logging
+import multiprocessing
+
+from django.conf import settings
+from django.db import connection, connections
+from django.utils.encoding import force_text
+
+from tbx.core.images import get_display_size, get_responsive_specs
+from tbx.core.models import TorchboxImage
+from tbx.core.prefetch import resolve_renditions
+
+
+logger = logging.getLogger(__name__)
+
+
+def close_connections():
+    # Forked processes mustn't share database connections with their parent,
+    # so close them before forking. Django reopens them when they are needed
+    for conn in connections.all():
+        conn.close()
+
+
+def get_rendition_specs(filter_spec):
+    # Display renditions are shown on their own, so they don't need any
+    # responsive variants
+    if get_display_size(filter_spec) is not None:
+        return [filter_spec]
+
+    return get_responsive_specs(filter_spec)
+
+
+def generate_renditions(image_id, filter_specs=None):
+    """
+    Generates the renditions of an image that don't exist yet, for the given
+    filter specs (PREGENERATED_RENDITIONS by default) and their responsive
+    and WebP variants. Returns an
+    (image_id, number generated, error message) tuple, so it can be used
+    with a process pool
+    """
+    if filter_specs is None:
+        filter_specs = settings.PREGENERATED_RENDITIONS
+
+    try:
+        image = TorchboxImage.objects.filter(id=image_id).first()
+        if image is None:
+            return image_id, 0, None
+
+        return image_id, resolve_renditions([
+            (image, variant)
+            for spec in filter_specs
+            for variant in get_rendition_specs(spec)
+        ]), None
+    except Exception as e:
+        logger.exception("Couldn't generate renditions for image %d", image_id)
+        return image_id, 0, force_text(e)
+
+
+# The pool used for generating renditions in the background. It is started
+# the first time an image is saved
+_pool = None
+
+# The (image id, filter specs) jobs waiting in the pool, so that an image
+# shown on many requests before its renditions exist is only queued once
+_queued = set()
+
+
+def generate_renditions_in_background(image_id, filter_specs=None):
+    """
+    Queues generate_renditions to run in a local process pool, off the
+    request path
+    """
+    global _pool
+
+    processes = getattr(settings, 'PREGENERATED_RENDITIONS_PROCESSES', 0)
+    if not processes:
+        return
+
+    # The image may not have been committed yet, in which case the pool
+    # wouldn't see it. The responsive_image tag queues them again the next
+    # time the image is shown (and the pregenerate_renditions command
+    # backfills them)
+    if connection.in_atomic_block:
+        return
+
+    job = (image_id, tuple(filter_specs) if filter_specs is not None else None)
+    if job in _queued:
+        return
+
+    if _pool is None:
+        close_connections()
+        _pool = multiprocessing.Pool(processes)
+
+    _queued.add(job)
+    _pool.apply_async(generate_renditions, job, callback=lambda result: _queued.discard(job))
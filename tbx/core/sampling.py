@@ -0,0 +1,52 @@
+import random
+import time
+
+from django.conf import settings
+
+from tbx.core.snapshots import Snapshot
+
+
+class Sampler(object):
+    """
+    Picks objects at random from a queryset without ORDER BY RANDOM(). The
+    ids of the objects that can be picked are kept in a Snapshot, so picking
+    costs one primary key query.
+
+    rotation_setting is the name of a setting with the number of seconds a
+    pick lasts for. Until then every process picks the same objects, so
+    whatever shows them can be cached. With 0 (the default), every call
+    picks again.
+    """
+    def __init__(self, key, get_queryset, rotation_setting):
+        self.get_queryset = get_queryset
+        self.rotation_setting = rotation_setting
+        self.pool = Snapshot('sample_pool:%s' % key, self.build_pool)
+
+    def build_pool(self):
+        return list(self.get_queryset().order_by('id').values_list('id', flat=True))
+
+    def sample_ids(self, count):
+        pool = self.pool.get()
+
+        rotation = getattr(settings, self.rotation_setting, 0)
+        if rotation:
+            generator = random.Random(int(time.time() // rotation))
+        else:
+            generator = random
+
+        return generator.sample(pool, min(count, len(pool)))
+
+    def sample(self, count, prefetch=None):
+        """
+        Returns up to count objects picked at random, loaded through a
+        tbx.core.prefetch.ListingPrefetch if one is given
+        """
+        ids = self.sample_ids(count)
+        if not ids:
+            return []
+
+        objects = self.get_queryset().model.objects.filter(id__in=ids)
+        objects = prefetch(objects) if prefetch else list(objects)
+
+        objects = dict((obj.id, obj) for obj in objects)
+        return [objects[obj_id] for obj_id in ids if obj_id in objects]
@@ -0,0 +1,218 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from wagtail.wagtailcore.models import Page, Site
+from wagtail.wagtailcore.signals import page_published, page_unpublished
+
+from tbx.core.dependencies import record_pages
+from tbx.core.frontend_cache import purge_page, purge_urls
+from tbx.core.models import BlogIndexPage, BlogPage, BlogPageAuthor, \
+    BlogPageTagSelect, WorkIndexPage, WorkPage, WorkPageAuthor, \
+    WorkPageTagSelect, PersonPage, TorchboxImage, AuthorSummaryMixin, PageDependency, \
+    JobIndexPage, blog_chain, index_pages, job_listings, people_sampler, work_siblings, \
+    get_saving_pages, tagged_page_saved
+from tbx.core.renditions import generate_renditions_in_background
+from tbx.core.utils import play_paths, play_menu, navigation, get_ancestor_paths
+
+
+# Index pages that keep tag counts and postings, with the page types they list
+TAGGED_INDEXES = (
+    (BlogIndexPage, BlogPage),
+    (WorkIndexPage, WorkPage),
+)
+
+
+def is_page_type(page, *models):
+    # Works for both specific and plain Page instances
+    return page.content_type_id in [
+        ContentType.objects.get_for_model(model).id for model in models
+    ]
+
+
+def page_tree_changed():
+    play_paths.invalidate()
+    navigation.invalidate()
+    play_menu.invalidate()
+    blog_chain.invalidate()
+    work_siblings.invalidate()
+    index_pages.invalidate()
+    people_sampler.pool.invalidate()
+
+
+def image_changed():
+    # Work page navigation shows homepage image thumbnails
+    work_siblings.invalidate()
+
+
+def invalidate_dependents(page_ids):
+    """
+    Throws away the cached content and purges the responses that were
+    recorded as showing any of the given pages
+    """
+    urls, cache_keys = PageDependency.get_dependents(page_ids)
+    if cache_keys:
+        cache.delete_many(list(cache_keys))
+    purge_urls(urls)
+
+
+def update_author_summaries(person_ids):
+    """
+    Updates the author summaries of the blog and work pages that have any of
+    the given people as authors
+    """
+    page_ids = []
+    for page_model in (BlogPage, WorkPage):
+        for page in page_model.objects.filter(related_author__author_id__in=person_ids).distinct():
+            page.update_author_summary()
+            page_ids.append(page.id)
+
+    # Wherever the pages are shown, their authors have changed
+    invalidate_dependents(page_ids)
+
+
+def update_tag_indexes(index, tag_ids=None):
+    index.update_tag_counts(tag_ids)
+    index.tag_postings.invalidate()
+
+
+def update_tag_indexes_above(page, tag_ids=None):
+    """
+    Updates the tag counts and postings of the index pages above a page, if
+    they list pages of its type
+    """
+    for index_model, page_model in TAGGED_INDEXES:
+        if is_page_type(page, page_model):
+            for index in index_model.objects.filter(path__in=get_ancestor_paths(page.path)):
+                update_tag_indexes(index, tag_ids)
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def page_published_or_unpublished(sender, instance, **kwargs):
+    page_tree_changed()
+
+    # Tag counts have been updated already. Publishing and unpublishing save
+    # the page, which tagged_page_saved_recount (or page_moved, for a plain
+    # Page) catches
+
+    if is_page_type(instance, JobIndexPage):
+        job_listings.invalidate()
+
+    if is_page_type(instance, PersonPage):
+        update_author_summaries([instance.id])
+
+
+@receiver(page_published)
+def page_published_author_summary(sender, instance, **kwargs):
+    if isinstance(instance, AuthorSummaryMixin):
+        instance.update_author_summary()
+
+
+# Run after the handlers above, so the purged pages are served up to date
+@receiver(page_published)
+@receiver(page_unpublished)
+def page_published_purge(sender, instance, **kwargs):
+    invalidate_dependents([instance.id])
+    purge_page(instance)
+
+
+# Every page loaded while something is being recorded is something it shows
+# (see tbx.core.dependencies). This is only connected to the page models, in
+# TorchboxCoreAppConfig.ready(), as post_init is sent for every row loaded.
+# The unsaved stand-ins made from snapshots are created with recording
+# paused, and whatever shows them records them itself
+def page_loaded(sender, instance, **kwargs):
+    if instance.pk:
+        record_pages([instance.pk])
+
+
+# Page.move() finishes by saving a plain Page object, so this catches moves
+@receiver(post_save, sender=Page)
+def page_moved(sender, instance, **kwargs):
+    page_tree_changed()
+
+    # The URLs of any people at or below the page have changed
+    update_author_summaries(PersonPage.objects.filter(path__startswith=instance.path).values_list('id', flat=True))
+
+    # We don't know where the page moved from, so recount every index that
+    # it could have affected
+    for index_model, page_model in TAGGED_INDEXES:
+        if is_page_type(instance, index_model, page_model):
+            for index in index_model.objects.all():
+                update_tag_indexes(index)
+
+
+@receiver(post_delete, sender=Page)
+def page_deleted(sender, instance, **kwargs):
+    page_tree_changed()
+    update_tag_indexes_above(instance)
+
+    if is_page_type(instance, JobIndexPage):
+        job_listings.invalidate()
+
+
+# Tags saved along with their page are recounted once it has been saved
+@receiver(tagged_page_saved)
+def tagged_page_saved_recount(sender, instance, **kwargs):
+    update_tag_indexes_above(instance)
+
+
+@receiver(post_save, sender=BlogPageTagSelect)
+@receiver(post_delete, sender=BlogPageTagSelect)
+@receiver(post_save, sender=WorkPageTagSelect)
+@receiver(post_delete, sender=WorkPageTagSelect)
+def tag_select_changed(sender, instance, **kwargs):
+    # Tags saved along with their page are recounted once it has been saved
+    # (see TaggedPageMixin). This catches the rest, such as the tags of
+    # copied pages
+    if instance.page_id in get_saving_pages():
+        return
+
+    # Only live pages are counted. The page may be in the middle of being
+    # deleted, in which case page_deleted catches up afterwards
+    page = Page.objects.filter(id=instance.page_id, live=True).first()
+    if page:
+        update_tag_indexes_above(page, [instance.tag_id])
+
+
+# Removing an author, or deleting the person, deletes one of these
+@receiver(post_delete, sender=BlogPageAuthor)
+@receiver(post_delete, sender=WorkPageAuthor)
+def page_author_deleted(sender, instance, **kwargs):
+    page_model = BlogPage if sender is BlogPageAuthor else WorkPage
+    page = page_model.objects.filter(id=instance.page_id).first()
+    if page:
+        page.update_author_summary()
+
+
+# Menu item URLs depend on the site root paths
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def site_changed(sender, instance, **kwargs):
+    navigation.invalidate()
+    play_menu.invalidate()
+
+
+# Saving an image can change its file or focal point, so generate the
+# standard renditions for it again
+@receiver(post_save, sender=TorchboxImage)
+def image_saved(sender, instance, **kwargs):
+    generate_renditions_in_background(instance.id)
+    image_changed()
+
+    # Author summaries have avatars
+    update_author_summaries(PersonPage.objects.filter(image=instance).values_list('id', flat=True))
+
+
+# People lose their image before it is deleted, so find them first
+@receiver(pre_delete, sender=TorchboxImage)
+def image_deleting(sender, instance, **kwargs):
+    instance._person_ids = list(PersonPage.objects.filter(image=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=TorchboxImage)
+def image_deleted(sender, instance, **kwargs):
+    image_changed()
+    update_author_summaries(getattr(instance, '_person_ids', []))
@@ -0,0 +1,89 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from tbx.core.dependencies import paused
+
+
+# Values held in this process, keyed by snapshot key. Each entry is a
+# (generation, value) tuple
+_local_values = {}
+
+# The generations of every snapshot, as this process last read them from the
+# database, and when it read them (see get_generations)
+_generations = {}
+
+
+def get_generations():
+    """
+    Returns the current generation of every snapshot that has been
+    invalidated, keyed by snapshot key. They are read from the database in one
+    query, at most every SNAPSHOT_GENERATION_CHECK_INTERVAL seconds.
+    """
+    from tbx.core.models import SnapshotGeneration
+
+    now = time.time()
+    checked_at = _generations.get('checked_at')
+    if checked_at is None or now - checked_at >= getattr(settings, 'SNAPSHOT_GENERATION_CHECK_INTERVAL', 2):
+        _generations['generations'] = dict(SnapshotGeneration.objects.values_list('key', 'generation'))
+        _generations['checked_at'] = now
+
+    return _generations['generations']
+
+
+class Snapshot(object):
+    """
+    A value that is expensive to build from the database, shared between
+    processes through the Django cache with a copy kept in process memory.
+
+    Each snapshot has a generation, kept in the database so that every web
+    host agrees on it (each host has its own cache). Reading a warm snapshot
+    costs no database queries or cache lookups, apart from reading every
+    snapshot's generation once every SNAPSHOT_GENERATION_CHECK_INTERVAL
+    seconds. Calling invalidate() moves the generation on, so every process
+    rebuilds the value once it sees the new generation.
+    """
+    def __init__(self, key, build, timeout=60 * 60 * 24):
+        self.key = key
+        self.build = build
+        self.timeout = timeout
+
+    def value_key(self, generation):
+        return 'snapshot:%s:%s' % (self.key, generation)
+
+    @property
+    def generation(self):
+        # Snapshots that have never been invalidated are on their first
+        # generation
+        return get_generations().get(self.key, '')
+
+    def get(self):
+        generation = self.generation
+
+        local = _local_values.get(self.key)
+        if local is not None and local[0] == generation:
+            return local[1]
+
+        value = cache.get(self.value_key(generation))
+        if value is None:
+            # Whoever uses the value records the pages they show from it
+            with paused():
+                value = self.build()
+            cache.set(self.value_key(generation), value, self.timeout)
+
+        _local_values[self.key] = (generation, value)
+        return value
+
+    def invalidate(self):
+        from tbx.core.models import SnapshotGeneration
+
+        generation = uuid.uuid4().hex
+        SnapshotGeneration.objects.update_or_create(key=self.key, defaults={'generation': generation})
+
+        # This process sees the new generation straight away
+        generations = dict(get_generations())
+        generations[self.key] = generation
+        _generations['generations'] = generations
+        _local_values.pop(self.key, None)
@@ -1,7 +1,18 @@
 from django import template
 from django.conf import settings
+from django.forms.utils import flatatt
+from django.utils.html import format_html
 
+from wagtail.wagtailimages.models import SourceImageIOError
+
+from tbx.core.cards import render_cards
+from tbx.core.dependencies import paused, record_pages
+from tbx.core.images import can_save_webp, get_display_spec, get_responsive_variants
 from tbx.core.models import *
+from tbx.core.prefetch import BLOG_POST_PREFETCH, PERSON_PREFETCH, \
+    WORK_PREFETCH, get_stream_renditions, resolve_renditions, \
+    resolve_responsive_renditions
+from tbx.core.renditions import generate_renditions_in_background
 from tbx.core.utils import *
 
 register = template.Library()
@@ -12,40 +23,121 @@ def get_popular_tags(model):
     return model.get_popular_tags()
 
 
+# Fetches all the renditions a StreamField needs at once, before it is shown
+@register.simple_tag
+def resolve_stream_renditions(stream):
+    resolve_responsive_renditions(get_stream_renditions(stream))
+    return ''
+
+
+# An image with a srcset of smaller versions and WebP versions of them all,
+# for browsers that support it. eg. {% responsive_image post.feed_image "fill-764x448" class="photo" %}
+# Only the requested size is created during the request. Variants that don't
+# exist yet are generated in the background and left out until they do, so
+# an image with none of them is a plain <img>
+@register.simple_tag
+def responsive_image(image, filter_spec, sizes='100vw', **attrs):
+    if not image:
+        return ''
+
+    try:
+        rendition = image.get_rendition(filter_spec)
+    except SourceImageIOError:
+        # The image file is missing, which is routine on local copies of the site
+        return ''
+
+    # Listings and StreamFields have already looked their variants up
+    variants = get_responsive_variants(filter_spec)
+    resolve_renditions([
+        (image, spec)
+        for variant in variants
+        for spec in variant
+        if spec != filter_spec and spec not in getattr(image, 'prefetched_renditions', {})
+    ], create=False)
+
+    def get_variant(spec):
+        if spec == filter_spec:
+            return rendition
+        return getattr(image, 'prefetched_renditions', {}).get(spec)
+
+    originals = [get_variant(spec) for spec, webp_spec in variants]
+    webps = [get_variant(webp_spec) for spec, webp_spec in variants]
+    if None in originals or (None in webps and can_save_webp()):
+        generate_renditions_in_background(image.id, [filter_spec])
+
+    originals = [original for original in originals if original is not None]
+    webps = [webp for webp in webps if webp is not None]
+
+    # The same alt text as the image tag (the image's title), unless one is given
+    attrs.setdefault('alt', image.title)
+
+    img = format_html(
+        '<img src="{0}"{1} width="{2}" height="{3}"{4}>',
+        rendition.url,
+        format_html(
+            ' srcset="{0}" sizes="{1}"',
+            ', '.join('%s %dw' % (original.url, original.width) for original in originals),
+            sizes,
+        ) if len(originals) > 1 else '',
+        rendition.width,
+        rendition.height,
+        flatatt(attrs),
+    )
+    if not webps:
+        return img
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{0}" sizes="{1}">{2}</picture>',
+        ', '.join('%s %dw' % (webp.url, webp.width) for webp in webps),
+        sizes,
+        img,
+    )
+
+
+# The image as large as the site shows images, at DISPLAY_IMAGE_MAX_SIZE.
+# eg. {% display_rendition screenshot.image as shot %}
+@register.assignment_tag
+def display_rendition(image):
+    if not image:
+        return None
+
+    try:
+        return image.get_rendition(get_display_spec())
+    except SourceImageIOError:
+        # Output a broken link in the same way as the image tag
+        rendition = image.renditions.model(image=image, width=0, height=0)
+        rendition.file.name = 'not-found'
+        return rendition
+
+
 # settings value
 @register.assignment_tag
 def get_googe_maps_key():
     return getattr(settings, 'GOOGLE_MAPS_KEY', "")
 
 
+# For work pages. These return WorkNeighbours, which have an id, title, url
+# and thumbnail
 @register.assignment_tag
 def get_next_sibling_by_order(page):
-    sibling = page.get_next_siblings().live().first()
-
-    if sibling:
-        return sibling.specific
+    return page.get_neighbours()[1]
 
 
 @register.assignment_tag
 def get_prev_sibling_by_order(page):
-    sibling = page.get_prev_siblings().live().first()
-
-    if sibling:
-        return sibling.specific
+    return page.get_neighbours()[0]
 
 
+# Blog navigation goes back in time, so the next post is the older one.
+# These return BlogNeighbours, which have an id, title and url
 @register.assignment_tag
 def get_next_sibling_blog(page):
-    sibling = BlogPage.objects.filter(date__lt=page.date).order_by('-date').live().first()
-    if sibling:
-        return sibling.specific
+    return page.get_neighbours()[0]
 
 
 @register.assignment_tag
 def get_prev_sibling_blog(page):
-    sibling = BlogPage.objects.filter(date__gt=page.date).order_by('-date').live().last()
-    if sibling:
-        return sibling.specific
+    return page.get_neighbours()[1]
 
 
 @register.assignment_tag(takes_context=True)
@@ -66,6 +158,7 @@ def content_type(value):
 
 
 @register.filter
+@request_memoize
 def in_play(page):
     return is_in_play(page)
 
@@ -76,37 +169,19 @@ def top_menu(context, calling_page=None):
     Checks to see if we're in the Play section in order to return pages with
     show_in_play_menu set to True, otherwise retrieves the top menu
     items - the immediate children of the site root. Also detects 404s in the
-    Play section.
+    Play section. Menu items come from the navigation and play_menu
+    snapshots as MenuItems.
     """
     if (calling_page and in_play(calling_page)) or context.get(
             'play_404', False
     ):
-        play_models = [
-            StandardPage,
-            PersonIndexPage,
-            WorkIndexPage,
-            WorkPage,
-            BlogIndexPage
-        ]
-        menuitems = chain.from_iterable([
-            model.objects.filter(
-                live=True,
-                show_in_play_menu=True,
-                show_in_menus=False
-            ).exclude(
-                show_in_play_menu=True,
-                show_in_menus=True
-            ) for model in play_models
-        ])
+        menuitems = get_play_menu_items()
     else:
-        menuitems = get_site_root(context).get_children().filter(
-            live=True,
-            show_in_menus=True
-        )
+        menuitems = get_menu_children(context['request'].site.root_page_id)
+    record_pages(item.id for item in menuitems)
     return {
         'calling_page': calling_page,
         'menuitems': menuitems,
-        # required by the pageurl tag that we want to use within this template
         'request': context['request'],
         'play_404': context.get('play_404', False)
     }
@@ -115,16 +190,11 @@ def top_menu(context, calling_page=None):
 # Retrieves the children of the top menu items for the drop downs
 @register.inclusion_tag('torchbox/tags/top_menu_children.html', takes_context=True)
 def top_menu_children(context, parent):
-    menuitems_children = parent.get_children()
-    menuitems_children = menuitems_children.filter(
-        live=True,
-        show_in_menus=True
-    )
+    menuitems_children = get_menu_children(parent.id)
+    record_pages(item.id for item in menuitems_children)
     return {
-        'calling_page': calling_page,
         'parent': parent,
         'menuitems_children': menuitems_children,
-        # required by the pageurl tag that we want to use within this template
         'request': context['request'],
     }
 
@@ -133,22 +203,19 @@ def top_menu_children(context, parent):
 @register.inclusion_tag('torchbox/tags/secondary_menu.html', takes_context=True)
 def secondary_menu(context, calling_page=None):
     menuitems = []
-    if calling_page and calling_page.id != get_site_root(context).id:
-        menuitems = calling_page.get_children().filter(
-            live=True,
-            show_in_menus=True
-        )
+    site_root_id = context['request'].site.root_page_id
+    if calling_page and calling_page.id != site_root_id:
+        menuitems = get_menu_children(calling_page.id)
 
         # If no children found and calling page parent isn't the root, get the parent's children
-        if len(menuitems) == 0 and calling_page.get_parent().id != get_site_root(context).id:
-            menuitems = calling_page.get_parent().get_children().filter(
-                live=True,
-                show_in_menus=True
-            )
+        if len(menuitems) == 0:
+            parent_id = get_menu_parent_id(calling_page)
+            if parent_id is not None and parent_id != site_root_id:
+                menuitems = get_menu_children(parent_id)
+    record_pages(item.id for item in menuitems)
     return {
         'calling_page': calling_page,
         'menuitems': menuitems,
-        # required by the pageurl tag that we want to use within this template
         'request': context['request'],
     }
 
@@ -156,8 +223,11 @@ def secondary_menu(context, calling_page=None):
 # Person feed for home page
 @register.inclusion_tag('torchbox/tags/homepage_people_listing.html', takes_context=True)
 def homepage_people_listing(context, count=3):
-    people = play_filter(PersonPage.objects.filter(live=True).order_by('?'),
-                         count)
+    # Different people are picked from request to request, so the homepage
+    # isn't recorded as showing them. Publishing a person purges it anyway
+    # (see frontend_cache.shows_on_homepage)
+    with paused():
+        people = people_sampler.sample(count, PERSON_PREFETCH)
     return {
         'people': people,
         # required by the pageurl tag that we want to use within this template
@@ -170,7 +240,7 @@ def homepage_people_listing(context, count=3):
 def homepage_blog_listing(context, count=3):
     blog_posts = play_filter(BlogPage.objects.filter(live=True).order_by('-date'), count)
     return {
-        'blog_posts': blog_posts,
+        'blog_posts': BLOG_POST_PREFETCH(blog_posts),
         # required by the pageurl tag that we want to use within this template
         'request': context['request'],
     }
@@ -182,7 +252,7 @@ def homepage_work_listing(context, count=3):
     work = play_filter(WorkPage.objects.filter(live=True),
                        count)
     return {
-        'work': work,
+        'work': WORK_PREFETCH(work),
         # required by the pageurl tag that we want to use within this template
         'request': context['request'],
     }
@@ -191,9 +261,13 @@ def homepage_work_listing(context, count=3):
 # Jobs feed for home page
 @register.inclusion_tag('torchbox/tags/homepage_job_listing.html', takes_context=True)
 def homepage_job_listing(context, count=3):
-    # Assume there is only one job index page
-    jobindex = JobIndexPage.objects.filter(live=True)[0]
-    jobs = jobindex.jobs
+    # Assume there is only one job index page. Its jobs come from the
+    # job_listings snapshot as JobListings
+    listings = job_listings.get()
+    jobs = []
+    if listings['first'] is not None:
+        jobs = listings['jobs'].get(listings['first'], [])
+        record_pages([listings['first']])
     if count:
         jobs = jobs[:count]
     return {
@@ -231,18 +305,18 @@ def work_and_blog_listing(context, count=10):
     """
     # Exercise for the reader: what should this do if count is an odd number?
     count /= 2
-    blog_posts = play_filter(BlogPage.objects.filter(live=True).order_by('-date'), count)
-    works = play_filter(WorkPage.objects.filter(live=True).order_by('-pk'), count)
-    blog_items = [template.loader.render_to_string(
-        "torchbox/tags/blog_list_item.html",
-        {'post': post,
-         'request': context['request']}
-    ) for post in blog_posts]
-    work_items = [template.loader.render_to_string(
-        "torchbox/tags/work_list_item.html",
-        {'work': work,
-         'request': context['request']}
-    ) for work in works]
+    blog_posts = BLOG_POST_PREFETCH.prepare(play_filter(BlogPage.objects.filter(live=True).order_by('-date'), count))
+    works = WORK_PREFETCH.prepare(play_filter(WorkPage.objects.filter(live=True).order_by('-pk'), count))
+
+    # Only the cards that have changed are rendered
+    blog_items = render_cards(
+        context['request'], "torchbox/tags/blog_list_item.html", 'post',
+        list(blog_posts), BLOG_POST_PREFETCH, 'feed_image'
+    )
+    work_items = render_cards(
+        context['request'], "torchbox/tags/work_list_item.html", 'work',
+        list(works), WORK_PREFETCH, 'homepage_image'
+    )
     return {
         'items': list(roundrobin(blog_items, work_items)),
         # required by the pageurl tag that we want to use within this template
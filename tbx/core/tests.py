@@ -0,0 +1,283 @@
+import datetime
+import shutil
+import tempfile
+from io import BytesIO
+
+from PIL import Image as PILImage
+
+from django.core.cache import cache
+from django.core.files.images import ImageFile
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from wagtail.wagtailcore.models import Page, Site
+
+from tbx.core import rendition_cache
+from tbx.core.models import HomePage, StandardPage, BlogIndexPage, BlogPage, \
+    BlogPageAuthor, BlogPageTagSelect, BlogPageTagList, WorkIndexPage, WorkPage, \
+    WorkPageScreenshot, PersonIndexPage, PersonPage, PageDependency, TorchboxImage
+from tbx.core.renditions import generate_renditions
+from tbx.core.snapshots import _generations, _local_values, get_generations
+from tbx.core.templatetags.torchbox_tags import responsive_image
+from tbx.core.utils import get_play_menu_items
+
+
+class SiteTestCase(TestCase):
+    """
+    Replaces Wagtail's initial page with a HomePage at the root of the
+    default site, and starts every test with empty caches
+    """
+    def setUp(self):
+        self.clear_caches()
+
+        root = Page.objects.get(depth=1)
+        for page in Page.objects.filter(depth=2):
+            page.delete()
+        root = Page.objects.get(depth=1)
+
+        self.home = root.add_child(instance=HomePage(title="Home", slug='home', live=True))
+        Site.objects.all().delete()
+        Site.objects.create(hostname='localhost', port=80, root_page=self.home, is_default_site=True)
+
+    def tearDown(self):
+        self.clear_caches()
+
+    def clear_caches(self):
+        cache.clear()
+        _local_values.clear()
+        _generations.clear()
+        rendition_cache._local.clear()
+
+
+class TestPlayMenu(SiteTestCase):
+    def setUp(self):
+        super(TestPlayMenu, self).setUp()
+
+        self.home.add_child(instance=StandardPage(
+            title="About", slug='about', live=True, show_in_menus=True, streamfield='[]'
+        ))
+        self.play = self.home.add_child(instance=StandardPage(
+            title="Play", slug='play', live=True, show_in_play_menu=True, streamfield='[]'
+        ))
+        self.play.add_child(instance=BlogIndexPage(
+            title="Play blog", slug='play-blog', live=True, show_in_play_menu=True
+        ))
+        self.play.add_child(instance=StandardPage(
+            title="Hidden", slug='hidden', live=False, show_in_play_menu=True, streamfield='[]'
+        ))
+
+        # Page URLs come from the site root paths, which Wagtail caches, and
+        # snapshot generations are only read every few seconds
+        Site.get_site_root_paths()
+        get_generations()
+
+    def test_play_menu_is_one_query(self):
+        with self.assertNumQueries(1):
+            menuitems = get_play_menu_items()
+
+        self.assertEqual([item.title for item in menuitems], ["Play", "Play blog"])
+        self.assertEqual([item.url for item in menuitems], ['/play/', '/play/play-blog/'])
+
+    def test_warm_play_menu_has_no_queries(self):
+        get_play_menu_items()
+
+        with self.assertNumQueries(0):
+            get_play_menu_items()
+
+
+class TestListingQueries(SiteTestCase):
+    """
+    The blog and work indexes should take the same number of queries to show
+    a page of posts however many posts are on it
+    """
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.media_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_override.enable()
+        super(TestListingQueries, self).setUp()
+
+        self.blog = self.home.add_child(instance=BlogIndexPage(title="Blog", slug='blog', live=True))
+        self.work = self.home.add_child(instance=WorkIndexPage(title="Work", slug='work', live=True))
+        people = self.home.add_child(instance=PersonIndexPage(title="People", slug='people', live=True))
+        self.tag = BlogPageTagList.objects.create(name="Tag", slug='tag')
+
+        self.images = [self.create_image(i) for i in range(3)]
+        self.people = [
+            people.add_child(instance=PersonPage(
+                title="Person %d" % i, slug='person-%d' % i, first_name="Person", last_name=str(i),
+                live=True, image=self.images[i]
+            ))
+            for i in range(2)
+        ]
+        self.count = 0
+
+    def tearDown(self):
+        super(TestListingQueries, self).tearDown()
+        self.media_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def create_image(self, number):
+        f = BytesIO()
+        PILImage.new('RGB', (1000, 800), (number * 50, 0, 0)).save(f, 'PNG')
+        return TorchboxImage.objects.create(title="Image %d" % number, file=ImageFile(f, name='image%d.png' % number))
+
+    def add_pages(self, count):
+        for i in range(self.count, self.count + count):
+            post = self.blog.add_child(instance=BlogPage(
+                title="Post %d" % i, slug='post-%d' % i, date=datetime.date(2015, 1, 1) + datetime.timedelta(days=i),
+                streamfield='[]', feed_image=self.images[i % 3]
+            ))
+            BlogPageAuthor.objects.create(page=post, author=self.people[i % 2])
+            BlogPageTagSelect.objects.create(page=post, tag=self.tag)
+            post.save_revision().publish()
+
+            work = self.work.add_child(instance=WorkPage(
+                title="Work %d" % i, slug='work-%d' % i, summary="Summary",
+                streamfield='[]', homepage_image=self.images[i % 3]
+            ))
+            WorkPageScreenshot.objects.create(page=work, image=self.images[(i + 1) % 3], sort_order=0)
+            WorkPageScreenshot.objects.create(page=work, image=self.images[(i + 2) % 3], sort_order=1)
+            work.save_revision().publish()
+
+        self.count += count
+
+    def count_queries(self, url, **extra):
+        # The first request creates the renditions, which are then loaded
+        # from the database with nothing cached
+        self.assertEqual(self.client.get(url, **extra).status_code, 200)
+        self.clear_caches()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, **extra).status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url, **extra):
+        self.add_pages(3)
+        queries = self.count_queries(url, **extra)
+
+        self.add_pages(3)
+        self.assertEqual(self.count_queries(url, **extra), queries)
+
+    def test_blog_index(self):
+        self.assertConstantQueries('/blog/')
+
+    def test_blog_index_tag_filter(self):
+        self.assertConstantQueries('/blog/?tag=tag')
+
+    def test_blog_listing_ajax(self):
+        self.assertConstantQueries('/blog/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_work_index(self):
+        self.assertConstantQueries('/work/')
+
+    def test_homepage(self):
+        self.assertConstantQueries('/')
+
+
+class TestBlogListingETag(SiteTestCase):
+    def setUp(self):
+        super(TestBlogListingETag, self).setUp()
+
+        blog = self.home.add_child(instance=BlogIndexPage(title="Blog", slug='blog', live=True))
+        self.post = blog.add_child(instance=BlogPage(
+            title="Post", slug='post', date=datetime.date(2015, 1, 1), streamfield='[]'
+        ))
+        self.post.save_revision().publish()
+
+    def get_listing(self, **extra):
+        return self.client.get('/blog/', HTTP_X_REQUESTED_WITH='XMLHttpRequest', **extra)
+
+    def test_etag_is_the_same_on_every_host(self):
+        etag = self.get_listing()['ETag']
+
+        # Another host has its own cache
+        self.clear_caches()
+        self.assertEqual(self.get_listing()['ETag'], etag)
+        self.assertEqual(self.get_listing(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_etag_changes_with_the_posts(self):
+        etag = self.get_listing()['ETag']
+
+        self.post.title = "New title"
+        self.post.save_revision().publish()
+
+        response = self.get_listing(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, "New title")
+
+
+class TestResponsiveImage(SiteTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.media_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_override.enable()
+        super(TestResponsiveImage, self).setUp()
+
+        f = BytesIO()
+        PILImage.new('RGB', (2000, 1000)).save(f, 'PNG')
+        self.image = TorchboxImage.objects.create(title="Image", file=ImageFile(f, name='image.png'))
+
+    def tearDown(self):
+        super(TestResponsiveImage, self).tearDown()
+        self.media_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_only_the_requested_size_is_created(self):
+        html = responsive_image(self.image, 'width-1280')
+
+        self.assertTrue(html.startswith('<img '))
+        self.assertEqual(self.image.renditions.count(), 1)
+
+    def test_variants_are_used_once_generated(self):
+        self.assertEqual(generate_renditions(self.image.id, ['width-1280']), (self.image.id, 6, None))
+
+        html = responsive_image(TorchboxImage.objects.get(id=self.image.id), 'width-1280')
+        self.assertTrue(html.startswith('<picture><source type="image/webp"'))
+        self.assertIn(' 400w', html)
+        self.assertIn(' 800w', html)
+
+    def test_variants_are_generated_without_webp(self):
+        # As with a build of Pillow without WebP support
+        PILImage.init()
+        webp = PILImage.SAVE.pop('WEBP')
+        try:
+            self.assertEqual(generate_renditions(self.image.id, ['width-1280']), (self.image.id, 3, None))
+
+            html = responsive_image(TorchboxImage.objects.get(id=self.image.id), 'width-1280')
+            self.assertTrue(html.startswith('<img '))
+            self.assertIn(' 400w', html)
+        finally:
+            PILImage.SAVE['WEBP'] = webp
+
+
+class TestPageDependencies(SiteTestCase):
+    def setUp(self):
+        super(TestPageDependencies, self).setUp()
+
+        self.people = self.home.add_child(instance=PersonIndexPage(title="People", slug='people', live=True))
+
+    def get_recorded_page_ids(self, url):
+        return set(PageDependency.objects.filter(url=url).values_list('page_id', flat=True))
+
+    def test_routing_isnt_recorded(self):
+        self.client.get('/people/')
+
+        # The homepage is only loaded to find the people index
+        page_ids = self.get_recorded_page_ids('http://testserver/people/')
+        self.assertIn(self.people.id, page_ids)
+        self.assertNotIn(self.home.id, page_ids)
+
+    def test_full_url_is_recorded(self):
+        self.client.get('/people/?utm_source=newsletter&page=2')
+
+        self.assertEqual(
+            set(PageDependency.objects.values_list('url', flat=True)),
+            set(['http://testserver/people/?utm_source=newsletter&page=2'])
+        )
+
+    def test_other_views_arent_recorded(self):
+        self.assertEqual(self.client.get('/blog/feed/').status_code, 200)
+
+        self.assertFalse(PageDependency.objects.exists())
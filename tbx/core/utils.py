@@ -1,8 +1,18 @@
 import hashlib
+import threading
 
+from collections import namedtuple
 from datetime import datetime, time, timedelta
+from functools import wraps
 from itertools import chain, cycle, islice
 
+from django.db.models import Q
+
+from wagtail.wagtailcore.models import Page
+
+from tbx.core.dependencies import paused
+from tbx.core.snapshots import Snapshot
+
 
 def export_event(event, format='ical'):
     # Only ical format supported at the moment
@@ -79,6 +89,41 @@ def export_event(event, format='ical'):
     return '\r'.join(ical_components)
 
 
+# Page types that have a 'show_in_play_menu' field, by their query name
+PLAY_PAGE_TYPES = (
+    'standardpage',
+    'workpage',
+    'workindexpage',
+    'personindexpage',
+    'blogindexpage',
+)
+
+
+def play_root_q():
+    """
+    A Q object matching pages that have 'show_in_play_menu' set to True,
+    for use in queries against Page.
+    """
+    q = Q()
+    for page_type in PLAY_PAGE_TYPES:
+        q |= Q(**{page_type + '__show_in_play_menu': True})
+    return q
+
+
+def build_play_paths():
+    paths = []
+    for path in Page.objects.filter(play_root_q()).order_by('path').values_list('path', flat=True):
+        # Play roots nested inside another Play root add nothing
+        if not paths or not path.startswith(paths[-1]):
+            paths.append(path)
+    return tuple(paths)
+
+
+# Tree paths of the pages that root the Play section. Rebuilt whenever a page
+# is published, unpublished, moved or deleted (see signal_handlers.py)
+play_paths = Snapshot('play_paths', build_play_paths)
+
+
 def is_in_play(page):
     """
     Check to see if a page is in the Play section. A page is in the Play
@@ -88,27 +133,175 @@ def is_in_play(page):
     if not page:
         return False
 
-    if getattr(page.specific, 'show_in_play_menu', False):
-        return True
+    return page.path.startswith(play_paths.get())
+
+
+def get_ancestor_paths(path):
+    """
+    Returns the tree paths of all the ancestors of the page with the given
+    path, root first
+    """
+    return [path[:length] for length in range(Page.steplen, len(path), Page.steplen)]
+
 
-    return any(
-        getattr(ancestor.specific, 'show_in_play_menu', False)
-        for ancestor in page.get_ancestors()
-    )
+# A lightweight stand-in for a Page in menus. 'parent' is the parent page's id
+MenuItem = namedtuple('MenuItem', ['id', 'title', 'url', 'depth', 'parent'])
+
+
+def get_page_url(page_id, url_path):
+    """
+    Returns the same URL as Page.url for a page with the given id and
+    url_path, without fetching the page.
+    """
+    # Giving the Page an id stops it looking up its content type. It isn't a
+    # page that was loaded, so it's not recorded
+    with paused():
+        page = Page(id=page_id, url_path=url_path)
+    return page.url
+
+
+def build_navigation():
+    # The main menu tree: every live page with 'show_in_menus' set
+    menu_pages = list(Page.objects.live().in_menu().order_by('path').values_list(
+        'id', 'title', 'url_path', 'path', 'depth'
+    ))
+
+    # Look up the ids of all the parents in one go
+    parent_paths = set(page[3][:-Page.steplen] for page in menu_pages)
+    page_ids = dict(Page.objects.filter(path__in=parent_paths).values_list('path', 'id'))
+
+    def menu_item(page_id, title, url_path, path, depth):
+        return MenuItem(
+            page_id, title, get_page_url(page_id, url_path),
+            depth, page_ids.get(path[:-Page.steplen])
+        )
+
+    children = {}
+    for page in menu_pages:
+        item = menu_item(*page)
+        children.setdefault(item.parent, []).append(item)
+
+    return {
+        'children': children,
+        # Maps the path of every page with menu children to its id
+        'page_ids': page_ids,
+    }
+
+
+# Snapshot of the site navigation. Rebuilt whenever a page is published,
+# unpublished, moved or deleted (see signal_handlers.py)
+navigation = Snapshot('navigation', build_navigation)
+
+
+def get_menu_children(page_id):
+    """
+    Returns MenuItems for the live children of a page that have
+    'show_in_menus' set, in tree order.
+    """
+    return navigation.get()['children'].get(page_id, [])
+
+
+def get_menu_parent_id(page):
+    """
+    Returns the id of a page's parent, if its parent has any menu children.
+    """
+    return navigation.get()['page_ids'].get(page.path[:-Page.steplen])
+
+
+def build_play_menu():
+    # Live pages that have 'show_in_play_menu' set and aren't in the main
+    # menu, in one query. The Play menu is flat, so its items have no parent
+    play_pages = Page.objects.live().filter(
+        play_root_q(),
+        show_in_menus=False
+    ).order_by('path').values_list('id', 'title', 'url_path', 'depth')
+
+    return [
+        MenuItem(page_id, title, get_page_url(page_id, url_path), depth, None)
+        for page_id, title, url_path, depth in play_pages
+    ]
+
+
+# Snapshot of the Play section menu. Rebuilt whenever a page is published,
+# unpublished, moved or deleted (see signal_handlers.py)
+play_menu = Snapshot('play_menu', build_play_menu)
+
+
+def get_play_menu_items():
+    """
+    Returns the Play section menu as a list of MenuItems in tree order.
+    """
+    return play_menu.get()
+
+
+def in_play_q():
+    """
+    A Q object matching every page in the Play section
+    """
+    q = Q()
+    for path in play_paths.get():
+        q |= Q(path__startswith=path)
+    return q
 
 
 def play_filter(pages, number=0):
     """
-    Given an iterable of Pages, return a specified number that
-    are not in the Play section.
+    Given a queryset of Pages, exclude those in the Play section and limit
+    the result to a specified number (0 for no limit). Both happen in the
+    database, so the result is still a lazy queryset.
+    """
+    if play_paths.get():
+        pages = pages.exclude(in_play_q())
+    if number > 0:
+        pages = pages[:number]
+    return pages
+
+
+# Per-request memo for page predicates, set up and torn down by
+# PagePredicateMemoMiddleware
+_request_memo = threading.local()
+
+
+def start_request_memo():
+    _request_memo.values = {}
+    _request_memo.hits = 0
+    _request_memo.misses = 0
+
+
+def end_request_memo():
+    """
+    Clears the current request's memo and returns its (hits, misses), or
+    None if there wasn't one.
     """
-    result = []
-    for page in pages:
-        if (number > 0) and (len(result) > (number - 1)):
-            break
-        if not is_in_play(page):
-            result.append(page)
-    return result
+    if getattr(_request_memo, 'values', None) is None:
+        return None
+
+    stats = (_request_memo.hits, _request_memo.misses)
+    _request_memo.values = None
+    return stats
+
+
+def request_memoize(predicate):
+    """
+    Decorator for functions of a single page that caches the result by page
+    id for the rest of the current request. Outside of a request it has no
+    effect.
+    """
+    @wraps(predicate)
+    def wrapper(page):
+        values = getattr(_request_memo, 'values', None)
+        if values is None or not page:
+            return predicate(page)
+
+        key = (predicate.__name__, page.id)
+        if key in values:
+            _request_memo.hits += 1
+        else:
+            _request_memo.misses += 1
+            values[key] = predicate(page)
+        return values[key]
+
+    return wrapper
 
 
 # https://docs.python.org/2/library/itertools.html#recipes
@@ -2,8 +2,12 @@ from django.utils.html import format_html_join, format_html
 from django.conf import settings
 
 from wagtail.wagtailcore import hooks
+from wagtail.wagtailcore.models import Site
 from wagtail.wagtailcore.whitelist import allow_without_attributes
 
+from tbx.core.dependencies import paused, start_page_recording
+from tbx.core.images import DisplayOperation, FormatOperation
+
 
 @hooks.register('construct_whitelister_element_rules')
 def whitelister_element_rules():
@@ -13,6 +17,14 @@ def whitelister_element_rules():
     }
 
 
+@hooks.register('register_image_operations')
+def register_image_operations():
+    return [
+        ('format', FormatOperation),
+        ('display', DisplayOperation),
+    ]
+
+
 @hooks.register('insert_editor_js')
 def editor_js():
     js_files = [
@@ -29,3 +41,16 @@ def editor_js():
         </script>
         """
     )
+
+
+# Start recording the pages the response shows from the page itself (see
+# PageDependencyMiddleware), rather than from the start of the request, as
+# routing loads the site's root page and every page down to this one. Page
+# URLs come from the site root paths, which load the root pages when they
+# aren't cached, so make sure they are first
+@hooks.register('before_serve_page')
+def record_served_page(page, request, serve_args, serve_kwargs):
+    with paused():
+        Site.get_site_root_paths()
+
+    start_page_recording([page.id])
@@ -116,6 +116,9 @@ MIDDLEWARE_CLASSES = (
     'wagtail.wagtailcore.middleware.SiteMiddleware',
 
     'wagtail.wagtailredirects.middleware.RedirectMiddleware',
+
+    'tbx.core.middleware.PagePredicateMemoMiddleware',
+    'tbx.core.middleware.PageDependencyMiddleware',
 )
 
 from django.conf import global_settings
@@ -219,6 +222,61 @@ WAGTAIL_USAGE_COUNT_ENABLED = True
 # Override the Image class used by wagtailimages with a custom one
 WAGTAILIMAGES_IMAGE_MODEL = 'torchbox.TorchboxImage'
 
+# The largest size images are shown at, for screenshots and anything else
+# that's shown "full size". Larger images are scaled down to fit
+DISPLAY_IMAGE_MAX_SIZE = (2000, 2000)
+
+# Renditions to generate in the background whenever an image is saved, so the
+# first visitor doesn't have to wait for them, along with their responsive and
+# WebP variants. These should match the image tags in the templates. The
+# pregenerate_renditions command backfills them
+PREGENERATED_RENDITIONS = (
+    'fill-764x448',
+    'fill-300x300',
+    'fill-80x80',
+    'width-300',
+    'fill-900x505',
+    'width-400',
+    'width-800',
+    'width-1024',
+    'width-1280',
+    'display-%dx%d' % DISPLAY_IMAGE_MAX_SIZE,
+)
+
+# Size of the process pool that generates them. Set to 0 to turn off
+# background generation
+PREGENERATED_RENDITIONS_PROCESSES = 2
+
+# The number of renditions' details each process keeps in memory, in front
+# of the cache, and how long they are kept in the cache for
+RENDITION_CACHE_SIZE = 1000
+RENDITION_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Widths that the responsive_image tag adds to an image's srcset, when they
+# are narrower than the image itself
+RESPONSIVE_IMAGE_WIDTHS = (400, 800, 1280)
+
+# How often each process reads the snapshot generations (see
+# tbx/core/snapshots.py) from the database. This is how long other processes
+# can keep using a snapshot after it has been invalidated, so keep it short:
+# the frontend cache is purged as soon as a publish finishes
+SNAPSHOT_GENERATION_CHECK_INTERVAL = 2
+
+# How long rendered listing cards are cached for. Cards are re-rendered
+# whenever their page changes, so this only matters when templates change
+CARD_CACHE_TIMEOUT = 60 * 60
+
+# How many seconds the home page shows the same people for. With 0, every
+# request picks different people
+HOMEPAGE_PEOPLE_ROTATION = 0
+
+# How long the pages a response showed are kept for after it was last
+# rendered (see PageDependency). Publishing one of the pages only
+# purges the responses recorded here, so this must be longer than the frontend
+# cache keeps pages for. The delete_old_page_dependencies command (run from
+# cron, see fabfile.py) deletes the older ones
+PAGE_DEPENDENCY_MAX_AGE = 7 * 24 * 60 * 60
+
 # Facebook JSSDK app Id
 FB_APP_ID = ''
 
@@ -11,8 +11,32 @@ WAGTAILSEARCH_BACKENDS = {
 }
 
 
-INSTALLED_APPS += (
-    'wagtail.contrib.wagtailfrontendcache',
+# Publishing purges the URLs it changes from the cache server, in batches (see
+# tbx.core.frontend_cache). wagtailfrontendcache isn't installed, as it would
+# purge every page on its own as well.
+#
+# Each production host (see env.roledefs in fabfile.py) runs its own Traffic
+# Server, and a publish happens on just one of them, so every URL is purged
+# from both. 8080 is Traffic Server's default port; check it against
+# proxy.config.http.server_ports on each host, and that ip_allow.config lets
+# the other host send PURGE requests. Override this in local.py if not
+WAGTAILFRONTENDCACHE = {
+    'web-1-a': {
+        'BACKEND': 'wagtail.contrib.wagtailfrontendcache.backends.HTTPBackend',
+        'LOCATION': 'http://web-1-a.rslon.torchbox.net:8080',
+    },
+    'web-1-b': {
+        'BACKEND': 'wagtail.contrib.wagtailfrontendcache.backends.HTTPBackend',
+        'LOCATION': 'http://web-1-b.rslon.torchbox.net:8080',
+    },
+}
+
+
+# Keep compiled templates between requests. Besides saving the parsing, this
+# lets each image tag keep the Filter it looked up, so listings don't look
+# up a Filter for every item
+TEMPLATE_LOADERS = (
+    ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
 )
 
 